@@ -11,6 +11,9 @@ from typing import List, Dict, Tuple
 import torch
 from transformers import AutoProcessor, AutoModelForVision2Seq
 from project_path import PROJECT_PATH
+from .utils.prefix_cache import QwenVLPrefixCache
+from .utils.camera_probe import CameraViewProbe, collect_labelled_frames
+from .utils.clip_ref import parse_clip_ref, iter_clip_frames
 
 def encode_image(image_path):
     with open(image_path, "rb") as image_file:
@@ -44,6 +47,8 @@ def _load_qwen_vl(model_id: str = "Qwen/Qwen2.5-VL-7B-Instruct") -> Tuple[AutoPr
         device_map="auto",
         trust_remote_code=True,
     ).eval()
+    # Batched generation needs the prompts aligned on the right
+    processor.tokenizer.padding_side = "left"
     return processor, model
 
 
@@ -71,7 +76,10 @@ def send_request_with_background(prompt, img_64=None, background=[], api_key=Non
     for msg in background:
         role = msg.get("role", "user")
         content = []
-        for item in msg.get("content", []):
+        items = msg.get("content", [])
+        if isinstance(items, str):
+            items = [{"type": "text", "text": items}]
+        for item in items:
             if item.get("type") == "text":
                 content.append({"type": "text", "text": item.get("text", "")})
             elif item.get("type") == "image_url":
@@ -101,67 +109,175 @@ def send_request_with_background(prompt, img_64=None, background=[], api_key=Non
     return output
 
 
-def CAMERA_DETECTION(query=None, material=[]):
-    example_path = f"{PROJECT_PATH}/pipeline/toolbox/utils/example_tiny" # Example images for learning camera positions
-    example_img = [os.path.join(example_path, f) for f in os.listdir(example_path)]
-    example_img = sorted(example_img)
-    camera_position = ["Close-up behind the goal", "Close-up corner", "Close-up player or field referee", "Close-up side staff", "Goal line technology camera", "Inside the goal", "Main behind the goal", "Main camera center", "Main camera left", "Main camera right", "Other", "Public", "Spider camera"]
-
-    learn_prompt = "I want you to help me identify the camera position of a football game photo. Now I will give you some example images, each of which corresponds to a specific camera position. Please learn the characteristics of these images for classification of new photos."
-
-    history = [{"role": "system", "content": learn_prompt}]
-    for i in range(len(example_img)):
-        content = [{"type": "text", "text": f"The camera position corresponding to this photo is: {camera_position[i]}"}]
-        base64_image = encode_image(example_img[i])
-        content.append(
-            {
-                "type": "image_url",
-                "image_url": {
-                    "url": f"data:image/png;base64,{base64_image}",
-                }
-            }
-        )
-        history.append({"role": "user", "content": content})
+CAMERA_POSITIONS = ["Close-up behind the goal", "Close-up corner", "Close-up player or field referee", "Close-up side staff", "Goal line technology camera", "Inside the goal", "Main behind the goal", "Main camera center", "Main camera left", "Main camera right", "Other", "Public", "Spider camera"]
 
+LEARN_PROMPT = "I want you to help me identify the camera position of a football game photo. Now I will give you some example images, each of which corresponds to a specific camera position. Please learn the characteristics of these images for classification of new photos."
+
+ASK_PROMPT = "What is the camera position in this picture? The answer should be chosen from the following options: [Main camera center, Close-up player or field referee, Close-up side staff, Main camera left, Main behind the goal, Close-up behind the goal, Spider camera, Main camera right, Public, Goal line technology camera, Close-up corner, Inside the goal, Other]."
+
+EXAMPLE_PATH = f"{PROJECT_PATH}/pipeline/toolbox/utils/example_tiny" # Example images for learning camera positions
+LABELLED_PATH = f"{PROJECT_PATH}/pipeline/toolbox/utils/camera_labelled" # Optional extra frames, one sub-folder per camera position
+
+
+@lru_cache(maxsize=1)
+def _load_example_images(example_path: str = EXAMPLE_PATH) -> Tuple[Image.Image, ...]:
+    example_img = sorted(os.path.join(example_path, f) for f in os.listdir(example_path))
+    return tuple(Image.open(path).convert("RGB") for path in example_img)
+
+
+def _fewshot_prefix_messages() -> List[Dict]:
+    """Learning prompt and exemplars shared by every query, images kept as in-memory PIL objects."""
+    messages = [{"role": "system", "content": [{"type": "text", "text": LEARN_PROMPT}]}]
+    for position, example in zip(CAMERA_POSITIONS, _load_example_images()):
+        messages.append({
+            "role": "user",
+            "content": [
+                {"type": "text", "text": f"The camera position corresponding to this photo is: {position}"},
+                {"type": "image", "image": example},
+            ],
+        })
+    return messages
+
+
+def _build_fewshot_messages(query_image: Image.Image) -> List[Dict]:
+    """Few-shot chat for one query frame."""
+    return _fewshot_prefix_messages() + [{
+        "role": "user",
+        "content": [
+            {"type": "text", "text": ASK_PROMPT},
+            {"type": "image", "image": query_image},
+        ],
+    }]
+
+
+@lru_cache(maxsize=1)
+def _load_prefix_cache(model_id: str = "Qwen/Qwen2.5-VL-7B-Instruct") -> QwenVLPrefixCache:
+    processor, model = _load_qwen_vl(model_id)
+    return QwenVLPrefixCache(processor, model, _fewshot_prefix_messages(), cache_dir=f"{PROJECT_PATH}/log/cache", tag="camera_fewshot")
+
+
+def _generate_replies(batch: List[Image.Image], max_new_tokens: int, use_prefix_cache: bool, model_id: str) -> List[str]:
+    processor, model = _load_qwen_vl(model_id)
+    messages = [_build_fewshot_messages(frame) for frame in batch]
+
+    if use_prefix_cache:
+        prefix_cache = _load_prefix_cache(model_id)
+        suffixes = [prefix_cache.split_suffix(msg) for msg in messages]
+        if all(suffix is not None for suffix in suffixes):
+            # Frames of different sizes give suffixes of different lengths, decode them separately
+            groups: Dict[Tuple[int, int], List[int]] = {}
+            for i, frame in enumerate(batch):
+                groups.setdefault(frame.size, []).append(i)
+            replies = [""] * len(batch)
+            for idxs in groups.values():
+                outputs = prefix_cache.generate([suffixes[i] for i in idxs], [batch[i] for i in idxs], max_new_tokens=max_new_tokens)
+                for i, reply in zip(idxs, outputs):
+                    replies[i] = reply
+            return replies
+
+    texts = [processor.apply_chat_template(msg, tokenize=False, add_generation_prompt=True) for msg in messages]
+    images = [item["image"] for msg in messages for turn in msg for item in turn["content"] if item["type"] == "image"]
+    inputs = processor(text=texts, images=images, padding=True, return_tensors="pt").to(model.device)
+
+    with torch.inference_mode():
+        generate_ids = model.generate(**inputs, max_new_tokens=max_new_tokens)
+    generate_ids = generate_ids[:, inputs.input_ids.shape[1]:]
+    return processor.batch_decode(generate_ids, skip_special_tokens=True)
+
+
+@lru_cache(maxsize=1)
+def _load_camera_probe() -> CameraViewProbe:
+    example_img = sorted(os.path.join(EXAMPLE_PATH, f) for f in os.listdir(EXAMPLE_PATH))
+    samples = list(zip(example_img, CAMERA_POSITIONS)) + collect_labelled_frames(LABELLED_PATH, CAMERA_POSITIONS)
+    return CameraViewProbe(CAMERA_POSITIONS, samples, cache_dir=f"{PROJECT_PATH}/log/cache")
+
+
+def _vote_decided(count: Counter, remaining: int) -> bool:
+    """True once no outcome of the remaining frames can change the majority label."""
+    if not count:
+        return False
+    ranked = count.most_common(2)
+    leader = ranked[0][1]
+    runner_up = ranked[1][1] if len(ranked) > 1 else 0
+    return leader > runner_up + remaining
+
+
+def classify_frames(frames: List[Image.Image], batch_size: int = 4, max_new_tokens: int = 32, early_stop: bool = True,
+                    use_prefix_cache: bool = True, model_id: str = "Qwen/Qwen2.5-VL-7B-Instruct") -> List[str]:
+    """
+    Classify the camera position of several frames with padded batch generation.
+
+    Args:
+        frames: Query frames as PIL images
+        batch_size: Number of query frames per generate call
+        max_new_tokens: Generation budget per frame, the answer is a short option string
+        early_stop: Stop once the majority vote over all frames can no longer change
+        use_prefix_cache: Reuse the prefilled KV cache of the few-shot exemplars, only the query is prefilled
+
+    Returns:
+        Camera positions of the frames that were processed, in frame order
+    """
+    answers: List[str] = []
+    count = Counter()
+
+    for start in range(0, len(frames), batch_size):
+        replies = _generate_replies(frames[start:start + batch_size], max_new_tokens, use_prefix_cache, model_id)
+        for reply in replies:
+            ans = extract_camera_position(reply)
+            answers.append(ans)
+            count[ans] += 1
+        if early_stop and _vote_decided(count, len(frames) - len(answers)):
+            break
+
+    return answers
+
+
+def read_video_frames(video_path: str, stride: int = 10) -> List[Image.Image]:
+    return [Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)) for _, frame in iter_clip_frames(video_path, stride)]
+
+
+def _calibrated_probe(fast_path):
+    """The camera probe when the fast path is requested and its confidences are calibrated, else None."""
+    if not fast_path:
+        return None
+    probe = _load_camera_probe()
+    if not probe.calibrated:
+        print(f"Camera probe temperature is not fitted on held-out frames, add labelled frames to {LABELLED_PATH}. Using the VLM only.")
+        return None
+    return probe
+
+
+def CAMERA_DETECTION(query=None, material=[], batch_size=4, fast_path=False, confidence_threshold=0.6):
     img_path = material[0]
-    file_extension = os.path.splitext(img_path)[1].lower()
+    probe = _calibrated_probe(fast_path)
+    file_extension = os.path.splitext(parse_clip_ref(img_path).path)[1].lower()
     image_extensions = ['.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff']
     video_extensions = ['.mp4', '.mkv', '.avi', '.mov', '.flv', '.webm']
 
     if file_extension in image_extensions:
-        base64_image = encode_image(img_path)
-        ask_prompt = "What is the camera position in this picture? The answer should be chosen from the following options: [Main camera center, Close-up player or field referee, Close-up side staff, Main camera left, Main behind the goal, Close-up behind the goal, Spider camera, Main camera right, Public, Goal line technology camera, Close-up corner, Inside the goal, Other]."
-        reply = send_request_with_background(ask_prompt, base64_image, history)
-        ans = extract_camera_position(reply)
-
+        frame = Image.open(img_path).convert("RGB")
+        if probe is not None:
+            ans, confidence = probe.predict([frame])[0]
+            if confidence >= confidence_threshold:
+                return f"The camera position in the photo is: {ans}."
+        ans = classify_frames([frame])[0]
         return f"The camera position in the photo is: {ans}."
     
     elif file_extension in video_extensions:
-        video_path = img_path
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
-            print(f"Cannnot open video: {video_path}")
-        frames_base64 = []
-        frame_count = 0
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            frame_count += 1
-            if frame_count % 10 != 0:
-                continue
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            pil_image = Image.fromarray(frame_rgb)
-            img_byte_arr = BytesIO()
-            pil_image.save(img_byte_arr, format='PNG')
-            img_base64 = base64.b64encode(img_byte_arr.getvalue()).decode('utf-8')
-            frames_base64.append(img_base64)
-        cap.release()
-        ask_prompt = "What is the camera position in this picture? The answer should be chosen from the following options: [Main camera center, Close-up player or field referee, Close-up side staff, Main camera left, Main behind the goal, Close-up behind the goal, Spider camera, Main camera right, Public, Goal line technology camera, Close-up corner, Inside the goal, Other]."
-        reply = []
-        for frame in frames_base64:
-            reply.append(send_request_with_background(ask_prompt, frame, history))
-        ans = [extract_camera_position(r) for r in reply]
-        count = Counter(ans)
+        frames = read_video_frames(img_path)
+        if not frames:
+            return "No frame could be read from the video."
+        count = Counter()
+        uncertain = frames
+        if probe is not None:
+            # Only frames the embedding classifier is unsure about are escalated to the VLM
+            uncertain = []
+            for frame, (ans, confidence) in zip(frames, probe.predict(frames)):
+                if confidence >= confidence_threshold:
+                    count[ans] += 1
+                else:
+                    uncertain.append(frame)
+        if uncertain and not _vote_decided(count, len(uncertain)):
+            count.update(classify_frames(uncertain, batch_size=batch_size))
         most_common_str, most_common_count = count.most_common(1)[0]
         return f"The camera position in the video is: {most_common_str}."
@@ -1,61 +1,181 @@
 import os
+import cv2
 import face_recognition
 import numpy as np
-import pickle
+from functools import lru_cache
+from multiprocessing import Pool
 from project_path import PROJECT_PATH
+from .utils.face_index import FaceIndex, FaceIndexStore
+from .utils.face_tracker import FaceTracker, vote_identity
+from .utils.clip_ref import parse_clip_ref, iter_clip_frames
 
-def build_face_library(base_path): # Base path to the SoccerWiki directory containing players' images.
-    VALID_IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
-    face_library = {}
+VALID_IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+FACE_INDEX_DIR = f"{PROJECT_PATH}/pipeline/toolbox/utils/face_index" # Incremental face index written by build_face_library
+
+
+def _player_signature(person_folder_path):
+    img_files = sorted([file for file in os.listdir(person_folder_path) if os.path.splitext(file)[1].lower() in VALID_IMAGE_EXTENSIONS])
+    signature = []
+    for img_file in img_files:
+        stat = os.stat(os.path.join(person_folder_path, img_file))
+        signature.append([img_file, stat.st_mtime_ns, stat.st_size])
+    return signature
+
+
+def _encode_player(task):
+    person_folder, person_folder_path, signature, max_encodings = task
+    encodings, images = [], []
+    for img_file, _, _ in signature:
+        image = face_recognition.load_image_file(os.path.join(person_folder_path, img_file))
+        face_encodings = face_recognition.face_encodings(image)
+        if face_encodings:
+            encodings.append(face_encodings[0])
+            images.append(img_file)
+            if len(encodings) == max_encodings:
+                break
+    return person_folder, signature, encodings, images
+
+
+def build_face_library(base_path, index_dir=FACE_INDEX_DIR, processes=None, max_encodings=3): # Base path to the SoccerWiki directory containing players' images.
+    """
+    Build or refresh the face index from the SoccerWiki player folders.
+
+    Players whose images are unchanged since the last build (same file names, mtimes and sizes) are
+    skipped, the others are encoded in a multiprocessing pool, keeping up to max_encodings faces each.
+
+    Returns:
+        Number of players (re-)encoded
+    """
+    store = FaceIndexStore(index_dir)
+    store.open_for_append()
     person_folders = sorted([folder for folder in os.listdir(base_path) if os.path.isdir(os.path.join(base_path, folder))])
 
+    for player in set(store.players()) - set(person_folders):
+        store.remove(player)
+    tasks = []
     for person_folder in person_folders:
         person_folder_path = os.path.join(base_path, person_folder)
-        
-        img_files = sorted([file for file in os.listdir(person_folder_path) if os.path.splitext(file)[1].lower() in VALID_IMAGE_EXTENSIONS])
-
-        for img_file in img_files:
-            img_path = os.path.join(person_folder_path, img_file)
-            image = face_recognition.load_image_file(img_path)
-            face_encodings = face_recognition.face_encodings(image)
-            
-            if face_encodings:
-                face_encoding = face_encodings[0]
-
-                face_library[person_folder] = face_encoding
-                print(f"Added {person_folder} to the face library.")
-                break
+        signature = _player_signature(person_folder_path)
+        if signature != store.signature(person_folder):
+            tasks.append((person_folder, person_folder_path, signature, max_encodings))
+    print(f"{len(person_folders) - len(tasks)} players unchanged, encoding {len(tasks)} players.")
+
+    with Pool(processes) as pool:
+        for i, (person_folder, signature, encodings, images) in enumerate(pool.imap_unordered(_encode_player, tasks, chunksize=8)):
+            # Players without a detectable face are recorded too, so they are not retried until their images change
+            store.put(person_folder, signature, encodings, images)
+            if encodings:
+                print(f"Added {person_folder} to the face library with {len(encodings)} encodings.")
+            # Commit regularly so an interrupted build resumes where it stopped
+            if (i + 1) % 500 == 0:
+                store.commit()
+    store.commit()
+    # Rewrite the files once most of the rows are stale
+    if len(store.manifest["dead_rows"]) > store.manifest["num_rows"] // 2:
+        store.compact()
+    print(f"Face library saved to {index_dir}.")
+
+    return len(tasks)
+
 
-    with open("face_library.pkl", 'wb') as f:
-        pickle.dump(face_library, f)
-    print(f"Face library saved to face_library.pkl.")
+FACE_LIBRARY = f"{PROJECT_PATH}/pipeline/toolbox/utils/face_library.pkl" # Replace with actual path to the face library
 
-    return face_library
+
+@lru_cache(maxsize=1)
+def _load_face_index(filename, mtime):
+    if os.path.isdir(filename):
+        return FaceIndex.from_store(filename)
+    return FaceIndex.from_pickle(filename)
+
+
+def get_face_index(filename=None):
+    """The resident face index, reloaded only when the library changes on disk."""
+    if filename is None:
+        filename = FACE_INDEX_DIR if FaceIndexStore(FACE_INDEX_DIR).exists() else FACE_LIBRARY
+    mtime_path = os.path.join(filename, "manifest.json") if os.path.isdir(filename) else filename
+    return _load_face_index(filename, os.path.getmtime(mtime_path))
+
+
+def recognize_video(material, face_index, sample_fps=2.0, scale=0.5, encodings_per_track=3, tolerance=0.6, min_hits=2):
+    """
+    Recognize the players appearing in a video or clip reference.
+
+    Frames are sampled at sample_fps and faces detected with HOG on a copy downscaled by scale.
+    Detections are chained into tracks by the FaceTracker, and each track is encoded at most
+    encodings_per_track times at full resolution. The index matches of a track's encodings are
+    then combined by a distance-weighted vote.
+
+    Returns:
+        One dict per identified track, longest tracks first:
+        {"name", "distance", "confidence", "first_frame", "last_frame", "hits", "encodings"}
+    """
+    ref = parse_clip_ref(material)
+    cap = cv2.VideoCapture(ref.path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    cap.release()
+    stride = max(1, int(round(fps / sample_fps)))
+
+    tracker = FaceTracker(encodings_per_track=encodings_per_track)
+    for index, frame in iter_clip_frames(material, stride):
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        small = cv2.resize(rgb, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        boxes = [tuple(int(round(v / scale)) for v in box) for box in face_recognition.face_locations(small)]
+
+        assigned = tracker.associate(boxes)
+        to_encode = [i for i, track in enumerate(assigned) if tracker.needs_encoding(track)]
+        encodings = {}
+        if to_encode:
+            face_encodings = face_recognition.face_encodings(rgb, known_face_locations=[boxes[i] for i in to_encode])
+            encodings = dict(zip(to_encode, face_encodings))
+        tracker.update(index, boxes, assigned, encodings)
+
+    results = []
+    for track in tracker.tracks:
+        if track.hits < min_hits or not track.encodings:
+            continue
+        identity = vote_identity([face_index.search(encoding, k=3) for encoding in track.encodings], tolerance)
+        if identity is None:
+            continue
+        name, distance, confidence = identity
+        results.append({
+            "name": name, "distance": distance, "confidence": confidence,
+            "first_frame": track.first_frame, "last_frame": track.last_frame,
+            "hits": track.hits, "encodings": len(track.encodings),
+        })
+    return sorted(results, key=lambda r: r["hits"], reverse=True)
 
 
 def FACE_RECOGNITION(query=None, material=[]):
-    filename = f"{PROJECT_PATH}/pipeline/toolbox/utils/face_library.pkl" # Replace with actual path to the face library
-    with open(filename, 'rb') as f:
-        face_library = pickle.load(f)
+    face_index = get_face_index()
 
     new_img_path = material[0]
+    if parse_clip_ref(new_img_path).path.lower().endswith(('.mp4', '.avi', '.mov', '.mkv', '.flv', '.webm')):
+        tracks = recognize_video(new_img_path, face_index)
+        if not tracks:
+            return "None"
+        lines = [
+            f"Track {i + 1} (frames {r['first_frame']}-{r['last_frame']}): most likely {r['name']}, distance: {r['distance']:.4f}, confidence: {r['confidence']:.2f}"
+            for i, r in enumerate(tracks)
+        ]
+        return "People recognized in the video:\n" + "\n".join(lines)
+
     new_image = face_recognition.load_image_file(new_img_path)
-    new_face_encodings = face_recognition.face_encodings(new_image)
-    
-    if new_face_encodings:
-        new_face_encoding = new_face_encodings[0]
-
-        distances = []
-        for person_name, stored_encoding in face_library.items():
-            distance = face_recognition.face_distance([stored_encoding], new_face_encoding)
-            distances.append((person_name, distance[0]))
-        
-        distances.sort(key=lambda x: x[1])
-        most_similar_person = distances[0]
-        # print(f"Match found: {most_similar_person[0]} with distance: {most_similar_person[1]}")
-        
-        return f"The person in the photo is most likely: {most_similar_person[0]}, distance: {most_similar_person[1]}"
-    
-    else:
-        # print("No face detected in the new image.")
+    # Faces are listed left to right
+    face_locations = sorted(face_recognition.face_locations(new_image), key=lambda box: box[3])
+    new_face_encodings = face_recognition.face_encodings(new_image, face_locations)
+
+    people = []
+    for (top, right, bottom, left), new_face_encoding in zip(face_locations, new_face_encodings):
+        matches = face_index.search(new_face_encoding, k=1)
+        if matches:
+            people.append(((left, top, right, bottom), matches[0]))
+    if not people:
         return "None"
+    if len(new_face_encodings) == 1:
+        name, distance = people[0][1]
+        return f"The person in the photo is most likely: {name}, distance: {distance}"
+    lines = [
+        f"Face {i + 1} (box {box}): most likely {name}, distance: {distance:.4f}"
+        for i, (box, (name, distance)) in enumerate(people)
+    ]
+    return f"{len(people)} people recognized in the photo, from left to right:\n" + "\n".join(lines)
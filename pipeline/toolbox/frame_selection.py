@@ -9,6 +9,7 @@ from transformers import CLIPProcessor, CLIPModel
 import ffmpeg
 import random
 from project_path import PROJECT_PATH
+from .utils.clip_ref import resolve_clip
 
 def select_rand_frame(video_path):
     output_dir = os.path.join(PROJECT_PATH, "log/cache")
@@ -56,7 +57,7 @@ def FRAME_SELECTION(query, material, output_dir=None):
     model.eval()
     processor = CLIPProcessor.from_pretrained("openai/clip-vit-large-patch14")
     
-    video_path = material[0]
+    video_path = resolve_clip(material[0])
     best_similarity = -np.inf
     best_frame = None
     
@@ -96,7 +97,7 @@ def FRAME_SELECTION(query, material, output_dir=None):
         best_frame.save(output_path, quality=95, subsampling=0)
         return f"The selected frame according to the prompt is save in {output_path}."
     try:
-        output_path = select_rand_frame(material[0])
+        output_path = select_rand_frame(video_path)
         return f"Cannot match the exact frame, so random selected a frame and saved in {output_path}."
     except:
         return "Failed in selecting frame!"
@@ -3,6 +3,7 @@ import sys, torch
 from project_path import PROJECT_PATH
 sys.path.append(f"{PROJECT_PATH}/pipeline/toolbox")
 from utils.vlm_distribution import vlm_model, vlm_processor
+from utils.clip_ref import resolve_clip
 
 
 def JERSEY_COLOR_VLM(query, material, vlm_model=vlm_model, vlm_processor=vlm_processor):
@@ -10,6 +11,7 @@ def JERSEY_COLOR_VLM(query, material, vlm_model=vlm_model, vlm_processor=vlm_pro
     material_path = material[0] if material else None
     if not material_path:
         raise ValueError("Material list is empty")
+    material_path = resolve_clip(material_path)
     
     file_extension = material_path.split('.')[-1].lower()
     media_type = None
@@ -1,17 +1,31 @@
 import os
-from .utils.jn import run
+from .utils.jn import get_jersey_number_service
 import torch
 import torch.backends.cudnn as cudnn
-from PIL import Image
 import re
 import csv
 
 from project_path import PROJECT_PATH  # dynamic project root
-def JERSEY_NUMBER_RECOGNITION(query=None, material=[]):
+
+MODEL_PATH = f"{PROJECT_PATH}/toolbox/utils/legibility_resnet34_soccer_20240215.pth" # Replace with your actual model path
+QWEN_PATH = "Qwen/Qwen2.5-VL-7B-Instruct"
+DIGIT_MODEL_PATH = f"{PROJECT_PATH}/pipeline/toolbox/utils/jersey_digits_cnn.pth" # Optional, the VLM reads every crop without it
+
+
+def _device():
     if torch.cuda.is_available() and torch.cuda.device_count() > 0:
-        device = torch.device(f"cuda:{torch.cuda.current_device()}")
-    else:
-        device = torch.device("cpu")
+        return torch.device(f"cuda:{torch.cuda.current_device()}")
+    return torch.device("cpu")
+
+
+def warmup_jersey_number_service():
+    """Load the jersey number models and run a dummy crop, e.g. at agent startup."""
+    cudnn.benchmark = True
+    get_jersey_number_service(_device(), MODEL_PATH, QWEN_PATH, threshold=0.5, digit_model_path=DIGIT_MODEL_PATH).warmup()
+
+
+def JERSEY_NUMBER_RECOGNITION(query=None, material=[]):
+    device = _device()
     cudnn.benchmark = True
 
     root_dir = material[0]
@@ -21,14 +35,10 @@ def JERSEY_NUMBER_RECOGNITION(query=None, material=[]):
             if file.lower().endswith('.jpg'):
                 material.append(os.path.join(root, file))
     material.sort(key=lambda x: int(re.search(r'(\d+)\.jpg', x).group(1)))
-    image_list = []
-    for path in material:
-        img = Image.open(path)
-        image_list.append(img)
-
-    model_path = f"{PROJECT_PATH}/toolbox/utils/legibility_resnet34_soccer_20240215.pth" # Replace with your actual model path
-    qwen_path = "Qwen/Qwen2.5-VL-7B-Instruct"
-    ans, result = run(device, image_list, model_path, qwen_path, threshold=0.5)
+
+    service = get_jersey_number_service(device, MODEL_PATH, QWEN_PATH, threshold=0.5, digit_model_path=DIGIT_MODEL_PATH)
+    # Crops are decoded on the fly, the tracklet is never loaded as a whole
+    ans, result = service.process_paths(material)
     ans = -1 if ans == None else ans
     ans = f"The jersey number in the pictures is {ans}."
     return ans
@@ -1,6 +1,7 @@
 from qwen_vl_utils import process_vision_info
 import torch
 from utils.vlm_distribution import vlm_model, vlm_processor
+from utils.clip_ref import resolve_clip
 import torch
 from PIL import Image
 import cv2
@@ -113,5 +114,5 @@ def chat_video(input_text, Instruction, video_path, model=vlm_model, processor=v
 def REPLAY_GROUNDING(query=None, material=[]):
     instruction = "You are a football expert. You are given five video clips, with the first being a replay. Your task is to identify the clip being replayed from the next four."
     text = "There are five video clips in total. The first clip is a replay. Which of the other four clips is the one it is replaying? Reply with 'the 1st clip' or 'the 2nd clip' or 'the 3rd clip' or 'the 4th clip'."
-    response = chat_video(text, instruction, material)
+    response = chat_video(text, instruction, [resolve_clip(path) for path in material])
     return response
@@ -1,71 +1,107 @@
-import easyocr, sys
-import re
+import sys
 import os
-import time
-from urllib.error import URLError
 from project_path import PROJECT_PATH
 sys.path.append(f"{PROJECT_PATH}/pipeline/toolbox")
 from vlm import VLM
+from utils.clip_ref import parse_clip_ref, clip_frame_range
+from utils.scoreboard_ocr import ScoreboardOCR, get_reader, parse_clock, parse_scoreboard
+from utils.clock_tracker import ClockTracker
 
-def extract_timestamp(image, max_retries=3):
+scoreboard_ocr = ScoreboardOCR(os.path.join(PROJECT_PATH, "log/cache/scoreboard_roi.json"))
+clock_tracker = ClockTracker(scoreboard_ocr, sample_fps=1.0)
 
-    reader = None
-    for attempt in range(max_retries):
-        try:
-            reader = easyocr.Reader(['en'], download_enabled=True, gpu=False)
-            break
-        except URLError as e:
-            print(f"Download failed easyocr model, Attempt: {attempt + 1}/{max_retries}: {e}")
-            if attempt == max_retries - 1:
-                return "Cannot download easyocr model."
-            time.sleep(5)  
+def extract_timestamp(image, max_retries=3, layout_key=None):
+    if get_reader(max_retries) is None:
+        return "Cannot download easyocr model."
     
     try:
-        results = reader.readtext(image)
-        
-        time_pattern = re.compile(r'(\d{1,2})[:.-](\d{2})')
+        results = scoreboard_ocr.read(image, layout_key)
         
         for (bbox, text, confidence) in results:
-            match = time_pattern.search(text)
-            if match:
-                minutes = int(match.group(1))
-                seconds = int(match.group(2))
-                
-                if 0 <= minutes <= 90 and 0 <= seconds < 60:
-                    return f"The timestamp detected by easy easyocr is {minutes} minutes {seconds} seconds."
+            clock = parse_clock(text)
+            if clock:
+                minutes, seconds = clock
+                return f"The timestamp detected by easy easyocr is {minutes} minutes {seconds} seconds."
         
         return "Cannot find timestamp via easyocr."
     
     except Exception as e:
         return f"Failed in processing with pic: {e}"
+
+
+def reading_confidence(reading):
+    """Confidence of a single-frame reading: both clock and score must be read, the weaker one counts."""
+    if reading["clock"] is None or reading["score"] is None:
+        return 0.0
+    return min(reading["clock_confidence"], reading["score_confidence"])
+
+
+def describe_reading(reading):
+    """Text summary of a parse_scoreboard reading that holds a clock."""
+    minutes, seconds = reading["clock"]
+    info = f"The timestamp detected by easyocr is {minutes} minutes {seconds} seconds"
+    if reading["score"] is not None:
+        teams = reading["teams"]
+        teams = f" ({teams[0]} vs {teams[1]})" if len(teams) == 2 else ""
+        info += f", and the score is {reading['score'][0]}-{reading['score'][1]}{teams}"
+    return info + "."
+
+
+def describe_track(track, time):
+    """Text summary of a clock track at a time of the source video, or None if no clock was read."""
+    clock = track.clock_at(time)
+    if clock is None:
+        return None
+    info = f"The timestamp tracked by easyocr over {len(track.inliers)} scoreboard readings is {clock[0]} minutes {clock[1]} seconds"
+    score = track.score_at(time)
+    if score is not None:
+        teams = f" ({track.teams[0]} vs {track.teams[1]})" if len(track.teams) == 2 else ""
+        info += f", and the score is {score[0]}-{score[1]}{teams}"
+    return info + "."
     
 
 import os
 from datetime import datetime
 import cv2
 
-def SCORE_TIME_DETECTION(query, material):
+def SCORE_TIME_DETECTION(query, material, ocr_confidence=0.6, force_vlm=False):
     """
     Detect timestamp and scoreboard information in football broadcast footage
     
     Args:
         query: Query prompt
         material: List containing file paths (typically length 1)
+        ocr_confidence: OCR confidence from which clock and score are answered directly, without the VLM
+        force_vlm: Always ask the VLM, using the OCR result only as a hint
     
     Returns:
-        Text result from VLM model
+        Text result from OCR when it is confident, else from VLM model
     """
     if not material or len(material) == 0:
         return "Error: No material provided"
     
     file_path = material[0]
+    clip = parse_clip_ref(file_path)
+    ocr_ready = get_reader() is not None
     
     if file_path.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif')):
         image_path = file_path
-    elif file_path.lower().endswith(('.mp4', '.avi', '.mov', '.mkv')):
-        cap = cv2.VideoCapture(file_path)
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        middle_frame = total_frames // 2
+        timestamp_info = "Cannot find timestamp via easyocr." if ocr_ready else "Cannot download easyocr model."
+        if ocr_ready:
+            try:
+                reading = parse_scoreboard(scoreboard_ocr.read(image_path) or [])
+            except Exception as e:
+                reading = None
+                timestamp_info = f"Failed in processing with pic: {e}"
+            if reading is not None and reading["clock"] is not None:
+                timestamp_info = describe_reading(reading)
+                if not force_vlm and reading_confidence(reading) >= ocr_confidence:
+                    return timestamp_info
+    elif clip.path.lower().endswith(('.mp4', '.avi', '.mov', '.mkv')):
+        cap = cv2.VideoCapture(clip.path)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        start_frame, end_frame = clip_frame_range(cap, clip)
+        middle_frame = (start_frame + end_frame) // 2
         
         cap.set(cv2.CAP_PROP_POS_FRAMES, middle_frame)
         ret, frame = cap.read()
@@ -73,17 +109,31 @@ def SCORE_TIME_DETECTION(query, material):
         
         if not ret:
             return "Error: Failed to extract middle frame from video"
+        # Clips of one match share the broadcast layout
+        layout_key = f"{os.path.dirname(os.path.abspath(clip.path))}|{frame.shape[1]}x{frame.shape[0]}"
+
+        timestamp_info = None
+        if ocr_ready:
+            try:
+                track = clock_tracker.track(file_path, layout_key)
+                timestamp_info = describe_track(track, middle_frame / fps)
+            except Exception as e:
+                # Falls back to reading the middle frame alone
+                print(f"Failed in tracking the clock of {file_path}: {e}")
+                track, timestamp_info = None, None
+            if timestamp_info is not None and not force_vlm and track.confidence() >= ocr_confidence:
+                return timestamp_info
         
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         cache_dir = os.path.join(PROJECT_PATH, "log/cache")
         os.makedirs(cache_dir, exist_ok=True)
         image_path = os.path.join(cache_dir, f"SCORE_TIME_DETECTION_{timestamp}.jpg")
         cv2.imwrite(image_path, frame)
+        if timestamp_info is None:
+            timestamp_info = extract_timestamp(frame, layout_key=layout_key)
     else:
         return "Error: Unsupported file format"
     
-    timestamp_info = extract_timestamp(image_path)
-    
     vlm_prompt = f"We first used easyocr to analyze this football footage and obtained: {timestamp_info}. {query}"
     
     vlm_result = VLM(vlm_prompt, [image_path])
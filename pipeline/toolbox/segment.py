@@ -1,71 +1,138 @@
 import os
-from pathlib import Path
-import json
-from .utils.GroundingDINO.demo.inference_on_a_image import inference_on_a_image
+import tempfile
+from functools import lru_cache
+from PIL import Image
+import numpy as np
 import cv2
 from project_path import PROJECT_PATH
+from .utils.clip_ref import parse_clip_ref, iter_clip_frames, clip_frame_indices, read_frames_at
+from .utils.grounding_detector import GroundingDetector
 
+CONFIG_FILE = f"{PROJECT_PATH}/pipeline/toolbox/utils/GroundingDINO/groundingdino/config/GroundingDINO_SwinB_cfg.py"
+MODEL_WEIGHTS = f"{PROJECT_PATH}/pipeline/toolbox/utils/GroundingDINO/groundingdino/config/groundingdino_swinb_cogcoor.pth"
 
-def SEGMENT(query=None, material=[]):
-    config_file = f"{PROJECT_PATH}/pipeline/toolbox/utils/GroundingDINO/groundingdino/config/GroundingDINO_SwinB_cfg.py"
-    model_weights = f"{PROJECT_PATH}/pipeline/toolbox/utils/GroundingDINO/groundingdino/config/groundingdino_swinb_cogcoor.pth"
+
+@lru_cache(maxsize=1)
+def get_detector(config_file=CONFIG_FILE, model_weights=MODEL_WEIGHTS):
+    return GroundingDetector(config_file, model_weights)
+
+
+def _best_frame(detector, frames, text, batch_size):
+    """Stream (index, RGB frame) pairs through the detector in batches, keeping only the frame with most detections."""
+    best = (None, None, 0)
+    batch = []
+
+    def flush():
+        nonlocal best
+        pred_dicts = detector.detect([frame for _, frame in batch], text, batch_size=batch_size)
+        for (frame_index, frame), pred_dict in zip(batch, pred_dicts):
+            if len(pred_dict['boxes']) > best[2]:
+                best = (frame, pred_dict, len(pred_dict['boxes']))
+        batch.clear()
+
+    for item in frames:
+        batch.append(item)
+        if len(batch) == batch_size:
+            flush()
+    if batch:
+        flush()
+    return best[0], best[1]
+
+
+def _coarse_to_fine_best_frame(detector, video_path, candidates, text, frame_budget, batch_size, frame_path=None):
+    """
+    Search the frame with most detections using at most frame_budget detector calls.
+
+    Frames spread evenly over the clip are checked first. Each refinement round then bisects the
+    gaps between the best frame and its nearest checked neighbours, so the window around the best
+    frame halves every round, and moves with it when a midpoint scores higher. The search runs
+    until the budget is spent or no unchecked frame is left next to the best one.
+    Evaluated frames are written to frame_path when given.
+    """
+    counts = {}
+    best = (None, None, 0)
+
+    def evaluate(positions):
+        nonlocal best
+        frames = read_frames_at(video_path, [candidates[p] for p in positions])
+        readable = [p for p in positions if candidates[p] in frames]
+        if frame_path is not None:
+            for p in readable:
+                cv2.imwrite(os.path.join(frame_path, f"frame_{candidates[p] + 1:04d}.jpg"), frames[candidates[p]])
+        images = [cv2.cvtColor(frames[candidates[p]], cv2.COLOR_BGR2RGB) for p in readable]
+        for position, image, pred_dict in zip(readable, images, detector.detect(images, text, batch_size=batch_size)):
+            counts[position] = len(pred_dict['boxes'])
+            if counts[position] > best[2]:
+                best = (image, pred_dict, counts[position])
+        # Unreadable frames still use up their budget so the loop terminates
+        for position in positions:
+            counts.setdefault(position, 0)
+
+    coarse = max(2, frame_budget // 2)
+    evaluate(sorted(set(np.linspace(0, len(candidates) - 1, coarse).round().astype(int).tolist())))
+    while len(counts) < frame_budget:
+        visited = sorted(counts)
+        best_position = max(visited, key=lambda p: (counts[p], -p))
+        i = visited.index(best_position)
+        left = visited[i - 1] if i > 0 else -1
+        right = visited[i + 1] if i + 1 < len(visited) else len(candidates)
+        picks = [p for p in ((left + best_position) // 2, (best_position + right) // 2)
+                 if left < p < right and p != best_position and p not in counts]
+        if not picks:
+            break
+        evaluate(sorted(set(picks))[:frame_budget - len(counts)])
+    return best[0], best[1]
+
+
+def SEGMENT(query=None, material=[], batch_size=8, save_frames=False, frame_budget=16):
     image_path = material[0]
     text = query
-    output_path = f"{PROJECT_PATH}/log/segment" # replace with your helper file path to save the output image
-    os.makedirs(output_path, exist_ok=True)
+    segment_path = f"{PROJECT_PATH}/log/segment" # replace with your helper file path to save the output image
+    os.makedirs(segment_path, exist_ok=True)
+    # Every call owns its directory so concurrent requests don't overwrite each other
+    output_path = tempfile.mkdtemp(prefix="segment_", dir=segment_path)
+    output_img = os.path.join(output_path, "pred.jpg")
+    detector = get_detector()
 
-    file_extension = os.path.splitext(image_path)[1].lower()
+    file_extension = os.path.splitext(parse_clip_ref(image_path).path)[1].lower()
     image_extensions = ['.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff']
     video_extensions = ['.mp4', '.mkv', '.avi', '.mov', '.flv', '.webm']
 
     if file_extension in image_extensions:
-        pred_dict = inference_on_a_image(config_file, model_weights, image_path, text, output_path)
-        output_img = os.path.join(output_path, "pred.jpg")
-        if os.path.exists(output_img):
+        image = Image.open(image_path).convert("RGB")
+        pred_dict = detector.detect([image], text)[0]
+        if len(pred_dict['boxes']) > 0:
+            detector.draw(image, pred_dict, output_img)
             descriptions = f"The object you want to segment has been prompted with bounding box on the image, which is saved at [{output_img}]."
         else:
             descriptions = "The object you want to segment isn't detected in the image."
 
     elif file_extension in video_extensions:
         video_path = image_path
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
-            raise ValueError(f"Cannot open video: {video_path}")
-        images_path = []
-        frame_count = 0
         stride = 10
         frame_path = os.path.join(output_path, 'frames')
-        if not os.path.exists(frame_path):
-            os.makedirs(frame_path)
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            frame_count += 1
-            if frame_count % stride != 0:
-                continue
-            frame_filename = os.path.join(frame_path, f"frame_{frame_count:04d}.jpg")
-
-            cv2.imwrite(frame_filename, frame)
-            images_path.append(frame_filename)
-        cap.release()
-        max_detections = -1
-        best_image_path = None
-        best_pred_dict = None
-
-        for image_path in images_path:
-            pred_dict = inference_on_a_image(config_file, model_weights, image_path, text, output_path)
-            current_detections = len(pred_dict['boxes'])
-            
-            if current_detections > max_detections:
-                max_detections = current_detections
-                best_image_path = image_path
-                best_pred_dict = pred_dict
+        if save_frames:
+            os.makedirs(frame_path, exist_ok=True)
+
+        def frames():
+            for frame_index, frame in iter_clip_frames(video_path, stride):
+                if save_frames:
+                    cv2.imwrite(os.path.join(frame_path, f"frame_{frame_index + 1:04d}.jpg"), frame)
+                yield frame_index, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+        candidates = clip_frame_indices(video_path, stride)
+        if frame_budget is not None and len(candidates) > frame_budget:
+            best_frame, best_pred_dict = _coarse_to_fine_best_frame(
+                detector, video_path, candidates, text, frame_budget, batch_size, frame_path if save_frames else None
+            )
+        else:
+            best_frame, best_pred_dict = _best_frame(detector, frames(), text, batch_size)
         if best_pred_dict is not None:
-            pred_dict = inference_on_a_image(config_file, model_weights, best_image_path, text, output_path)
-            output_img = os.path.join(output_path, "pred.jpg")
-            if os.path.exists(output_img):
-                descriptions = f"The object you want to segment has been prompted with bounding box on the image, which is saved at [{output_img}]."
-            else:
-                descriptions = "The object you want to segment isn't detected in the video."
+            # The best frame's predictions are reused for drawing, no second forward pass
+            detector.draw(best_frame, best_pred_dict, output_img)
+            descriptions = f"The object you want to segment has been prompted with bounding box on the image, which is saved at [{output_img}]."
+        else:
+            descriptions = "The object you want to segment isn't detected in the video."
+    else:
+        descriptions = "The provided file is neither a supported image nor a video."
     return descriptions
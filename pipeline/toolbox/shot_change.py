@@ -1,52 +1,97 @@
-from scenedetect import VideoManager, SceneManager
-from scenedetect.detectors import ContentDetector
-# from moviepy.editor import VideoFileClip
-from moviepy import *
 import os
+import time
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from project_path import PROJECT_PATH
+from .utils.clip_ref import ClipRef, cut_stream_copy, cut_encode, parse_clip_ref
+from .utils.shot_detector import FastShotDetector, content_detector_scenes
 
 def is_video_file(file_path):
     video_extensions = ['.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv', '.webm']
     _, ext = os.path.splitext(file_path)
     return ext.lower() in video_extensions
 
-def SHOT_CHANGE(query=None, material=[]):
+def detect_scenes(video_path, detector="content", start=0.0, end=None):
+    """Scene boundaries of a video, or of its range from start to end seconds, as (start, end) seconds of the video."""
+    if detector == "fast":
+        return FastShotDetector().detect(video_path, start, end)
+    if detector != "content":
+        raise ValueError(f"Unsupported detector: {detector}")
+    return content_detector_scenes(video_path, start, end)
+
+def export_clips(clips, output_dir, mode="copy", max_workers=None):
+    """
+    Write clips to files concurrently.
+
+    Args:
+        clips: ClipRef list
+        output_dir: Directory owned by this request
+        mode: "copy" for stream-copy cuts, "encode" for frame-accurate libx264 re-encodes
+        max_workers: Pool size, defaults to the number of available cores
+
+    Returns:
+        List of written clip paths, in clip order
+    """
+    cut = {"copy": cut_stream_copy, "encode": cut_encode}.get(mode)
+    if cut is None:
+        raise ValueError(f"Unsupported mode: {mode}")
+    if max_workers is None:
+        max_workers = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    max_workers = max(1, min(max_workers, len(clips)))
+    ext = ".mp4" if mode == "encode" else os.path.splitext(clips[0].path)[1]
+    tasks = [(clip, os.path.join(output_dir, f"scene_{i+1}{ext}")) for i, clip in enumerate(clips)]
+
+    tic = time.perf_counter()
+    # ffmpeg does the work in its own process, threads are enough to keep several running, and the
+    # agent process, holding CUDA contexts and tokenizer threads, is never forked
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        list(pool.map(lambda task: cut(*task), tasks))
+    elapsed = time.perf_counter() - tic
+
+    video_seconds = sum(clip.end - clip.start for clip in clips)
+    print(f"Exported {len(clips)} clips ({video_seconds:.1f}s of video) with {max_workers} workers in {elapsed:.1f}s: "
+          f"{len(clips) / elapsed:.2f} clips/s, {video_seconds / elapsed:.1f}x realtime.")
+    return [new_video_path for _, new_video_path in tasks]
+
+def SHOT_CHANGE(query=None, material=[], mode="copy", detector="content"):
+    """
+    Split a video into shots.
+
+    Args:
+        query: Unused
+        material: List holding one video path
+        mode: How the clips are handed to the next tool
+            "virtual": clip references "path#t=start,end" into the source video, nothing is written
+            "copy": clips cut with stream copy, no re-encoding, boundaries snap to keyframes
+            "encode": frame-accurate clips re-encoded with libx264
+        detector: "content" for scenedetect's ContentDetector, "fast" for the vectorized low-resolution
+            detector, which is opt-in until its agreement with ContentDetector is benchmarked
+        Written clips go to a fresh directory per call, so concurrent calls don't overwrite each other.
+    """
     if len(material) == 0:
         return "No video material provided."
     if len(material) > 1:
         return "Only one video material is supported at a time. But you provided more than one."
-    video_path = material[0]
-    if not is_video_file(video_path):
+    if mode not in ("virtual", "copy", "encode"):
+        return f"Unsupported mode: {mode}. Use 'virtual', 'copy' or 'encode'."
+    source = parse_clip_ref(material[0])
+    if not is_video_file(source.path):
         return "The provided file is not a valid video file."
-    
-    video_manager = VideoManager([video_path])
-    scene_manager = SceneManager()
-    
-    scene_manager.add_detector(ContentDetector())
-    
-    video_manager.set_downscale_factor()
-    video_manager.start()
-    
-    scene_manager.detect_scenes(video_manager)
-
-    scene_list = scene_manager.get_scene_list()
-
-    video_clip = VideoFileClip(video_path)
-    if len(scene_list) == 0:
+
+    # Scenes of a clip reference are detected on its range of the source video, nothing is cut
+    scene_list = detect_scenes(source.path, detector, source.start, source.end)
+    if len(scene_list) <= 1:
         return "No scene changes detected in the video."
-    output_path = []
-    change_time = []
-    for i, scene in enumerate(scene_list):
-        start_time = scene[0].get_seconds()
-        end_time = scene[1].get_seconds()
-        # print(f"Scene {i+1}: Start = {start_time} sec, End = {end_time} sec")
-        change_time.append(end_time)
-        scene_clip = video_clip.subclipped(start_time, end_time)
-        shot_path = f"{PROJECT_PATH}/log/clip_tmp" # Replace with actual helper files path to save the temporary clips
-        os.makedirs(shot_path, exist_ok=True)
-        new_video_path = f"{shot_path}/scene_{i+1}.mp4"
-        output_path.append(new_video_path)
-        scene_clip.write_videofile(new_video_path, codec="libx264")
-
-    video_clip.close()
+    change_time = [end_time for _, end_time in scene_list]
+    clips = [ClipRef(source.path, start_time, end_time) for start_time, end_time in scene_list]
+
+    if mode == "virtual":
+        output_path = [str(clip) for clip in clips]
+        return f"Shot change detection completed. {len(scene_list)} scenes detected. The clips are referenced as {output_path}. Change occurred at {change_time[:-1]} seconds."
+
+    shot_path = f"{PROJECT_PATH}/log/clip_tmp" # Replace with actual helper files path to save the temporary clips
+    os.makedirs(shot_path, exist_ok=True)
+    request_path = tempfile.mkdtemp(prefix="shot_", dir=shot_path)
+    output_path = export_clips(clips, request_path, mode=mode)
+
     return f"Shot change detection completed. {len(scene_list)} scenes detected. The clips are saved in {output_path}. Change occurred at {change_time[:-1]} seconds."
@@ -94,3 +94,26 @@ def set_transform(
     # 创建 SiglipProcessor 实例
     processor = AutoProcessor.from_pretrained(model_name)
     return processor
+
+
+class SiglipTensorTransform:
+    """
+    Batched equivalent of the SigLIP image processor on a (T, C, H, W) uint8 tensor.
+
+    Resizes with antialiased bicubic interpolation, rounds to the uint8 range like the PIL
+    resize of the processor, then rescales and normalizes with the processor's constants.
+    Runs on whatever device the frames are on.
+    """
+
+    def __init__(self, processor):
+        image_processor = getattr(processor, "image_processor", processor)
+        self.size = (image_processor.size["height"], image_processor.size["width"])
+        self.rescale_factor = image_processor.rescale_factor
+        self.mean = torch.tensor(image_processor.image_mean).view(1, -1, 1, 1)
+        self.std = torch.tensor(image_processor.image_std).view(1, -1, 1, 1)
+
+    def __call__(self, frames):
+        frames = frames.float()
+        frames = torch.nn.functional.interpolate(frames, size=self.size, mode="bicubic", align_corners=False, antialias=True)
+        frames = frames.round().clamp(0, 255) * self.rescale_factor
+        return (frames - self.mean.to(frames.device)) / self.std.to(frames.device)
@@ -1,10 +1,13 @@
+import os
 import torch
 from einops import rearrange
 import sys
 from project_path import PROJECT_PATH
 sys.path.append(f"{PROJECT_PATH}/pipeline/toolbox/unisoccer")
 from model.MatchVision_classifier import MatchVision_Classifier
-from dataset.video_utils_siglip import read_frames_decord, set_transform
+from dataset.video_utils_siglip import read_frames_decord, set_transform, SiglipTensorTransform
+from inference.tensor_cache import TensorCache
+from inference.feature_store import PrecomputedFeatures
 sys.path.append(f"{PROJECT_PATH}/pipeline/toolbox")
 sys.path.append(PROJECT_PATH)
 from utils.all_devices import unisoccer_device
@@ -13,18 +16,29 @@ DEVICE = unisoccer_device
 print("Unisoccer on:",DEVICE)
 
 class VideoPreprocessor:
-    def __init__(self, num_frames=30, sampling_method="middle", device=DEVICE):
+    def __init__(self, num_frames=30, sampling_method="middle", device=DEVICE, cache_size=16, cache_dir=None, cache_max_bytes=2 * 1024 ** 3):
         """
         Initialize video preprocessor with transformation pipeline.
         
         Args:
             num_frames (int): Number of frames to sample from video
             sampling_method (str): Frame sampling method ('middle', 'uniform', etc.)
+            cache_size (int): Number of preprocessed clips kept in memory
+            cache_dir (str): Directory persisting preprocessed clips as float16 .npy, None for memory only
+            cache_max_bytes (int): Size of cache_dir beyond which the least recently used clips are deleted
         """
         self.num_frames = num_frames
         self.sampling_method = sampling_method
         self.transform_func = set_transform()
+        self.tensor_transform = SiglipTensorTransform(self.transform_func)
         self.device = device
+        self.cache = TensorCache(cache_size, cache_dir, cache_max_bytes)
+
+    def clip_key(self, video_path):
+        """Cache key of a clip, None when the sampling is random."""
+        if self.sampling_method == "rand":
+            return None
+        return (os.path.abspath(video_path), os.path.getmtime(video_path), self.num_frames, self.sampling_method)
 
     def __call__(self, video_path):  # ✅ 添加 __call__ 方法
         return self.preprocess(video_path)
@@ -40,6 +54,13 @@ class VideoPreprocessor:
             torch.Tensor: Processed video tensor of shape (1, C, T, H, W)
             tuple: Additional info (frame_indices, duration)
         """
+        # Random sampling gives a different clip tensor on every call, so it is never cached
+        key = self.clip_key(video_path)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached.to(self.device)
+
         # Read and sample frames from video
         frames, frame_indices, duration = read_frames_decord(
             video_path, 
@@ -47,17 +68,17 @@ class VideoPreprocessor:
             self.sampling_method
         )
         
-        # Apply transformations to each frame
-        frames = torch.cat([
-            self.transform_func(images=frame, return_tensors="pt")["pixel_values"] 
-            for frame in frames
-        ], dim=0)
+        # Apply the SigLIP transform to all frames at once, on the target device
+        frames = self.tensor_transform(frames.to(self.device))
         
         # Rearrange dimensions: (T, C, H, W) -> (C, T, H, W)
         frames = rearrange(frames, 't c h w -> c t h w')
         
         # Add batch dimension: (C, T, H, W) -> (1, C, T, H, W)
-        return frames.unsqueeze(dim=0).to(self.device)
+        frames = frames.unsqueeze(dim=0)
+        if key is not None:
+            self.cache.put(key, frames)
+        return frames.to(self.device)
 
 # ----------------------------
 # Classification Module
@@ -96,10 +117,88 @@ class VideoClassifier:
         with torch.no_grad():
             return self.classifier.get_logits(video_tensor).to("cpu")
 
+    def classify_features(self, features):
+        """Run the classification head on backbone features from get_backbone_features."""
+        with torch.no_grad():
+            return self.classifier.get_logits_from_features(features).to("cpu")
+
+
+# ----------------------------
+# Shared Visual Features
+# ----------------------------
+def same_weights(module_a, module_b):
+    """Whether two modules hold identical parameters and buffers."""
+    state_a, state_b = module_a.state_dict(), module_b.state_dict()
+    if state_a.keys() != state_b.keys():
+        return False
+    return all(state_a[k].shape == state_b[k].shape and torch.equal(state_a[k].cpu(), state_b[k].cpu()) for k in state_a)
+
+
+class VisualFeatures:
+    def __init__(self, preprocessor, encoders, cache_size=16, precomputed=None):
+        """
+        Spatio-temporal backbone features of a clip, computed once per clip and encoder.
+
+        Encoders holding identical weights are merged, so tools asking for either of them
+        share one encoder pass and one cache entry. Features extracted offline by
+        extract_features.py are looked up before anything is decoded.
+
+        Args:
+            preprocessor (VideoPreprocessor): Produces the clip tensors
+            encoders (dict): Name -> VisionTimesformer
+            cache_size (int): Number of feature tensors kept in memory
+            precomputed (dict): Name -> PrecomputedFeatures of that encoder
+        """
+        self.preprocessor = preprocessor
+        self.encoders = encoders
+        self.precomputed = {
+            name: store for name, store in (precomputed or {}).items()
+            if store is not None and store.matches(preprocessor.num_frames, preprocessor.sampling_method)
+        }
+        self.aliases = {}
+        for name, encoder in encoders.items():
+            self.aliases[name] = next(
+                (other for other in self.aliases.values() if same_weights(encoders[other], encoder)), name
+            )
+        self.cache = TensorCache(cache_size)
+
+    def __call__(self, video_path, name):
+        """
+        Features of the clip from the named encoder.
+
+        Returns:
+            torch.Tensor: Encoder output for the (1, C, T, H, W) clip tensor, on the preprocessor's device
+        """
+        encoder_name = self.aliases[name]
+        clip_key = self.preprocessor.clip_key(video_path)
+        key = (clip_key, encoder_name)
+        if clip_key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached.to(self.preprocessor.device)
+
+        features = None
+        for store_name in (name, encoder_name):
+            if store_name in self.precomputed:
+                features = self.precomputed[store_name].get(video_path)
+                if features is not None:
+                    features = features.to(self.preprocessor.device)
+                    break
+        if features is None:
+            video_tensor = self.preprocessor(video_path)
+            with torch.no_grad():
+                features = self.encoders[encoder_name](video_tensor)
+        if clip_key is not None:
+            self.cache.put(key, features)
+        return features
+
 
 CHECKPOINT_PATH_CLASSIFICATION = f"{PROJECT_PATH}/pipeline/toolbox/unisoccer/inference/checkpoints/pretrained_classification.pth" # Refer to https://huggingface.co/Homie0609/UniSoccer/blob/main/pretrained_classification.pth
 
-preprocessor = VideoPreprocessor(num_frames=30, sampling_method="middle", device=DEVICE)
+CLIP_CACHE_DIR = None # e.g. f"{PROJECT_PATH}/log/cache/unisoccer_clips" to persist preprocessed clips across runs, about 9 MB each
+CLIP_CACHE_MAX_BYTES = 2 * 1024 ** 3 # Least recently used clips are deleted beyond this size
+
+preprocessor = VideoPreprocessor(num_frames=30, sampling_method="middle", device=DEVICE, cache_dir=CLIP_CACHE_DIR, cache_max_bytes=CLIP_CACHE_MAX_BYTES)
 classifier = VideoClassifier(CHECKPOINT_PATH_CLASSIFICATION, DEVICE)
 
 
@@ -111,3 +210,12 @@ commentary_state_dict = {k.replace('module.', ''): v for k, v in state_dict.item
 
 commentary_model.load_state_dict(commentary_state_dict)
 commentary_model.to(DEVICE)
+
+FEATURE_DIR = f"{PROJECT_PATH}/log/features" # One subdirectory per encoder, written by extract_features.py
+
+visual_features = VisualFeatures(preprocessor, {
+    "classification": classifier.classifier.siglip_model,
+    "commentary": commentary_model.visual_encoder,
+}, precomputed={
+    name: PrecomputedFeatures.open(f"{FEATURE_DIR}/{name}") for name in ("classification", "commentary")
+})
@@ -0,0 +1,174 @@
+"""
+Offline MatchVision feature extraction over a directory of clips.
+
+Clips are decoded and transformed by DataLoader workers, encoded in batches, and the features
+written as float16 shards of shard_size clips with a manifest mapping every clip to its row.
+The manifest is rewritten after every shard, so an interrupted run resumes with the clips not
+yet in it, and clips modified since their extraction are extracted again.
+
+    python extract_features.py --video_dir /data/clips --output_dir log/features/classification --encoder classification
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from project_path import PROJECT_PATH
+sys.path.append(f"{PROJECT_PATH}/pipeline/toolbox/unisoccer")
+
+import numpy as np
+import torch
+from einops import rearrange
+from torch.utils.data import Dataset, DataLoader
+from model.MatchVision import VisionTimesformer
+from dataset.video_utils_siglip import read_frames_decord, set_transform, SiglipTensorTransform
+
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.avi', '.mov', '.webm')
+CHECKPOINTS = {
+    "classification": f"{PROJECT_PATH}/pipeline/toolbox/unisoccer/inference/checkpoints/pretrained_classification.pth",
+    "commentary": f"{PROJECT_PATH}/pipeline/toolbox/unisoccer/inference/checkpoints/downstream_commentary_all_open.pth",
+}
+# Prefix of the VisionTimesformer weights in each checkpoint, after removing DDP's 'module.'
+ENCODER_PREFIXES = {
+    "classification": "siglip_model.",
+    "commentary": "visual_encoder.",
+}
+
+
+class ClipDataset(Dataset):
+    def __init__(self, video_dir, relpaths, num_frames, sampling_method):
+        self.video_dir = video_dir
+        self.relpaths = relpaths
+        self.num_frames = num_frames
+        self.sampling_method = sampling_method
+        self.transform = SiglipTensorTransform(set_transform())
+
+    def __len__(self):
+        return len(self.relpaths)
+
+    def __getitem__(self, idx):
+        relpath = self.relpaths[idx]
+        try:
+            frames, _, _ = read_frames_decord(os.path.join(self.video_dir, relpath), self.num_frames, self.sampling_method)
+        except Exception as e:
+            print(f"Skipping {relpath}: {e}")
+            return None
+        return rearrange(self.transform(frames), 't c h w -> c t h w'), relpath
+
+
+def collate(items):
+    items = [item for item in items if item is not None]
+    if not items:
+        return None, []
+    return torch.stack([item[0] for item in items]), [item[1] for item in items]
+
+
+def load_encoder(name, checkpoint_path, device):
+    encoder = VisionTimesformer(encoder_type="spatial_and_temporal")
+    state_dict = torch.load(checkpoint_path, map_location="cpu")['state_dict']
+    prefix = ENCODER_PREFIXES[name]
+    encoder_state_dict = {}
+    for k, v in state_dict.items():
+        k = k.replace('module.', '')
+        if k.startswith(prefix):
+            encoder_state_dict[k[len(prefix):]] = v
+    encoder.load_state_dict(encoder_state_dict)
+    return encoder.to(device).eval()
+
+
+def list_clips(video_dir):
+    relpaths = []
+    for root, _, files in os.walk(video_dir):
+        for file in files:
+            if file.lower().endswith(VIDEO_EXTENSIONS):
+                relpaths.append(os.path.relpath(os.path.join(root, file), video_dir))
+    return sorted(relpaths)
+
+
+def load_manifest(output_dir, video_dir, args):
+    path = os.path.join(output_dir, "manifest.json")
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            manifest = json.load(f)
+        settings = (manifest["video_dir"], manifest["encoder"], manifest["num_frames"], manifest["sampling_method"])
+        if settings != (video_dir, args.encoder, args.num_frames, args.sampling_method):
+            raise ValueError(f"{output_dir} holds features extracted with other settings: {settings}")
+        return manifest
+    return {
+        "video_dir": video_dir, "encoder": args.encoder,
+        "num_frames": args.num_frames, "sampling_method": args.sampling_method,
+        "shards": [], "clips": {},
+    }
+
+
+def save_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, "manifest.json")
+    with open(path + ".tmp", 'w') as f:
+        json.dump(manifest, f)
+    os.replace(path + ".tmp", path)
+
+
+def write_shard(output_dir, manifest, features, relpaths, mtimes):
+    name = f"shard_{len(manifest['shards']):05d}.npy"
+    path = os.path.join(output_dir, name)
+    np.save(path + ".tmp.npy", np.stack(features).astype(np.float16))
+    os.replace(path + ".tmp.npy", path)
+    manifest["shards"].append(name)
+    for row, (relpath, mtime) in enumerate(zip(relpaths, mtimes)):
+        manifest["clips"][relpath] = {"shard": name, "row": row, "mtime": mtime}
+    save_manifest(output_dir, manifest)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract MatchVision backbone features of a directory of clips")
+    parser.add_argument("--video_dir", required=True)
+    parser.add_argument("--output_dir", required=True)
+    parser.add_argument("--encoder", choices=sorted(CHECKPOINTS), default="classification")
+    parser.add_argument("--checkpoint", default=None, help="Defaults to the checkpoint the online tool loads for this encoder")
+    parser.add_argument("--num_frames", type=int, default=30)
+    parser.add_argument("--sampling_method", default="middle")
+    parser.add_argument("--batch_size", type=int, default=16)
+    parser.add_argument("--num_workers", type=int, default=8)
+    parser.add_argument("--shard_size", type=int, default=1024)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    video_dir = os.path.abspath(args.video_dir)
+    os.makedirs(args.output_dir, exist_ok=True)
+    manifest = load_manifest(args.output_dir, video_dir, args)
+
+    relpaths = list_clips(video_dir)
+    mtimes = {relpath: os.path.getmtime(os.path.join(video_dir, relpath)) for relpath in relpaths}
+    todo = [p for p in relpaths if manifest["clips"].get(p, {}).get("mtime") != mtimes[p]]
+    print(f"{len(relpaths) - len(todo)} clips already extracted, extracting {len(todo)}.")
+    if not todo:
+        return
+
+    encoder = load_encoder(args.encoder, args.checkpoint or CHECKPOINTS[args.encoder], args.device)
+    loader = DataLoader(
+        ClipDataset(video_dir, todo, args.num_frames, args.sampling_method),
+        batch_size=args.batch_size, num_workers=args.num_workers, collate_fn=collate,
+        pin_memory=args.device.startswith("cuda"), persistent_workers=args.num_workers > 0,
+    )
+
+    features, shard_relpaths = [], []
+    done, start = 0, time.time()
+    with torch.no_grad():
+        for clips, batch_relpaths in loader:
+            if clips is None:
+                continue
+            output = encoder(clips.to(args.device, non_blocking=True)).float().cpu().numpy()
+            features.extend(output)
+            shard_relpaths.extend(batch_relpaths)
+            done += len(batch_relpaths)
+            if len(features) >= args.shard_size:
+                write_shard(args.output_dir, manifest, features, shard_relpaths, [mtimes[p] for p in shard_relpaths])
+                features, shard_relpaths = [], []
+                print(f"{done}/{len(todo)} clips, {done / (time.time() - start):.1f} clips/s")
+    if features:
+        write_shard(args.output_dir, manifest, features, shard_relpaths, [mtimes[p] for p in shard_relpaths])
+    print(f"Extracted {done} clips in {time.time() - start:.1f}s to {args.output_dir}.")
+
+
+if __name__ == "__main__":
+    main()
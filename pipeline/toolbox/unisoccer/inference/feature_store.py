@@ -0,0 +1,51 @@
+import os
+import json
+
+import numpy as np
+import torch
+
+
+class PrecomputedFeatures:
+    """
+    Read access to the sharded backbone features written by extract_features.py.
+
+    The manifest maps every clip, relative to the extracted video directory, to a row of a
+    shard file. Shards are memory-mapped on first use, so a lookup only reads one row.
+    """
+
+    def __init__(self, feature_dir):
+        """
+        Args:
+            feature_dir (str): Output directory of extract_features.py, holding manifest.json and the shards
+        """
+        self.feature_dir = feature_dir
+        with open(os.path.join(feature_dir, "manifest.json"), "r") as f:
+            self.manifest = json.load(f)
+        self.video_dir = self.manifest["video_dir"]
+        self._shards = {}
+
+    @classmethod
+    def open(cls, feature_dir):
+        """The store in feature_dir, or None if nothing was extracted there."""
+        if not os.path.exists(os.path.join(feature_dir, "manifest.json")):
+            return None
+        return cls(feature_dir)
+
+    def matches(self, num_frames, sampling_method):
+        return self.manifest["num_frames"] == num_frames and self.manifest["sampling_method"] == sampling_method
+
+    def get(self, video_path):
+        """
+        Features of a clip, or None if it wasn't extracted or changed since.
+
+        Returns:
+            torch.Tensor: float32 features with a leading batch dimension of 1
+        """
+        relpath = os.path.relpath(os.path.abspath(video_path), self.video_dir)
+        entry = self.manifest["clips"].get(relpath)
+        if entry is None or entry["mtime"] != os.path.getmtime(video_path):
+            return None
+        shard = entry["shard"]
+        if shard not in self._shards:
+            self._shards[shard] = np.load(os.path.join(self.feature_dir, shard), mmap_mode="r")
+        return torch.from_numpy(np.array(self._shards[shard][entry["row"]], dtype=np.float32)).unsqueeze(0)
@@ -0,0 +1,99 @@
+import os
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+
+class TensorCache:
+    """
+    LRU of CPU tensors with an optional on-disk store.
+
+    Tensors are kept in memory as given. With a cache_dir, every entry is also saved as a
+    float16 .npy file named after the hash of its key, and entries evicted from memory or
+    missing after a restart are read back from disk. The store is an LRU too: files are touched
+    when read, and the least recently used ones are deleted once it outgrows max_disk_bytes.
+    """
+
+    def __init__(self, capacity=16, cache_dir=None, max_disk_bytes=2 * 1024 ** 3):
+        """
+        Args:
+            capacity (int): Number of tensors kept in memory
+            cache_dir (str): Directory of the .npy store, None to keep the cache in memory only
+            max_disk_bytes (int): Size the .npy store is trimmed to
+        """
+        self.capacity = capacity
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()
+        self._disk_bytes = 0
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, _, size in self._disk_entries())
+
+    def _path(self, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.npy")
+
+    def _disk_entries(self):
+        """(mtime, path, size) of the files of the store."""
+        entries = []
+        for file in os.listdir(self.cache_dir):
+            if not file.endswith(".npy") or file.endswith(".tmp.npy"):
+                continue
+            path = os.path.join(self.cache_dir, file)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, path, stat.st_size))
+        return entries
+
+    def _trim_disk(self):
+        # Rescanned rather than trusted, other processes may share the directory
+        entries = sorted(self._disk_entries())
+        self._disk_bytes = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._disk_bytes -= size
+
+    def _remember(self, key, tensor):
+        self._entries[key] = tensor
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def get(self, key, dtype=torch.float32):
+        """The cached tensor, or None. Tensors read from disk are cast to dtype."""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        if self.cache_dir is not None and os.path.exists(self._path(key)):
+            try:
+                tensor = torch.from_numpy(np.load(self._path(key))).to(dtype)
+                os.utime(self._path(key))
+            except FileNotFoundError:
+                # Evicted by another process in the meantime
+                return None
+            self._remember(key, tensor)
+            return tensor
+        return None
+
+    def put(self, key, tensor):
+        tensor = tensor.detach().cpu()
+        self._remember(key, tensor)
+        if self.cache_dir is not None:
+            path = self._path(key)
+            # Written under a temporary name so readers never see a partial file
+            tmp_path = path + ".tmp.npy"
+            np.save(tmp_path, tensor.to(torch.float16).numpy())
+            os.replace(tmp_path, path)
+            self._disk_bytes += os.path.getsize(path)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._trim_disk()
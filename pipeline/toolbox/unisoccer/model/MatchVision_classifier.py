@@ -50,8 +50,13 @@ class MatchVision_Classifier(nn.Module):
         return loss, logits
     
     def get_logits(self, x):
-        B, _, _, _, _ = x.shape
-        x = self.siglip_model(x)
+        return self.get_logits_from_features(self.get_backbone_features(x))
+
+    def get_backbone_features(self, x):
+        return self.siglip_model(x)
+
+    def get_logits_from_features(self, x):
+        B = x.shape[0]
         x = self.classifier_ln1(x)
 
         if hasattr(self, "cls_token"):
@@ -1,19 +1,20 @@
 import sys
 from project_path import PROJECT_PATH
 sys.path.append(f"{PROJECT_PATH}/pipeline/toolbox/unisoccer")
-from inference.distribution import preprocessor, classifier, commentary_model
+from inference.distribution import preprocessor, classifier, commentary_model, visual_features
+sys.path.append(f"{PROJECT_PATH}/pipeline/toolbox")
+from utils.clip_ref import resolve_clip
 import einops
 
 import torch
 import torch.nn.functional as F
 
-def classify_video(video_path, preprocessor=preprocessor, classifier=classifier):
+def classify_video(video_path, preprocessor=preprocessor, classifier=classifier, visual_features=visual_features):
 
     CLASS_NAMES = ["var", "end of half game", "clearance", "second yellow card", "injury", "ball possession", "throw in", "show added time", "shot off target", "start of half game", "substitution", "saved by goal-keeper", "red card", "lead to corner", "ball out of play", "off side", "goal", "penalty", "yellow card", "foul lead to penalty", "corner", "free kick", "foul with no card"]
     
     with torch.no_grad():
-        video_tensor = preprocessor(video_path)
-        logits = classifier.classify(video_tensor)
+        logits = classifier.classify_features(visual_features(video_path, "classification"))
     
     probs = F.softmax(logits, dim=-1).squeeze().cpu()
     
@@ -34,15 +35,17 @@ def format_top_predictions(prob_dict, threshold=0.05):
     return ", ".join(top_predictions)
 
 def ACTION_CLASSIFICATION(query, material):
-    video_result = classify_video(material[0])
+    video_result = classify_video(resolve_clip(material[0]))
     response = f"The classification probabilities of this soccer video clip is: {format_top_predictions(video_result)} (only above 5% mentioned)."
     return response
 
 
-def commentary_video(video_path, preprocessor=preprocessor, commentary_model=commentary_model):
+def commentary_video(video_path, preprocessor=preprocessor, commentary_model=commentary_model, visual_features=visual_features):
+    return commentary_from_features(visual_features(video_path, "commentary"), commentary_model)
+
+
+def commentary_from_features(video_features, commentary_model=commentary_model):
     with torch.no_grad():
-        video_tensor = preprocessor(video_path)
-        video_features = commentary_model.visual_encoder(video_tensor)
         batch_size = None
         time_length = None
         try:
@@ -85,6 +88,6 @@ def commentary_video(video_path, preprocessor=preprocessor, commentary_model=com
 
 
 def COMMENTARY_GENERATION(query, material):
-    video_path = material[0]
+    video_path = resolve_clip(material[0])
     result = f"The according commentary to this video is: {commentary_video(video_path)}"
     return result
@@ -0,0 +1,150 @@
+import os
+import hashlib
+from typing import List, Optional, Tuple
+
+import numpy as np
+import torch
+from PIL import Image
+from transformers import AutoModel, AutoProcessor
+
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff'}
+
+
+def collect_labelled_frames(labelled_dir: str, labels: List[str]) -> List[Tuple[str, str]]:
+    """(path, label) pairs from a directory laid out as <labelled_dir>/<camera position>/<image>."""
+    samples = []
+    if not os.path.isdir(labelled_dir):
+        return samples
+    for label in labels:
+        label_dir = os.path.join(labelled_dir, label)
+        if not os.path.isdir(label_dir):
+            continue
+        for file in sorted(os.listdir(label_dir)):
+            if os.path.splitext(file)[1].lower() in IMAGE_EXTENSIONS:
+                samples.append((os.path.join(label_dir, file), label))
+    return samples
+
+
+class CameraViewProbe:
+    """
+    Nearest-centroid camera view classifier over frozen SigLIP/CLIP image embeddings.
+
+    Each camera position is represented by the normalized mean embedding of its labelled frames.
+    A frame is scored by cosine similarity to every centroid, and a temperature-scaled softmax
+    turns the similarities into confidences. The temperature is fitted by leave-one-out on the
+    labelled frames when at least one class has two or more of them. `calibrated` tells whether
+    that happened on at least min_calibration_frames held-out frames. Otherwise the confidences
+    come from the default temperature and should not be thresholded.
+    """
+
+    def __init__(self, labels: List[str], samples: List[Tuple[str, str]], model_name: str = "google/siglip-base-patch16-224",
+                 device: Optional[str] = None, cache_dir: Optional[str] = None, temperature: float = 0.05,
+                 min_calibration_frames: int = 20):
+        """
+        Args:
+            labels: Class names, in the order of the returned probabilities
+            samples: Labelled frames as (path, label) pairs
+            model_name: Frozen image encoder used for the embeddings
+            device: Torch device, defaults to cuda when available
+            cache_dir: Directory where the fitted centroids are persisted
+            temperature: Softmax temperature used when it cannot be fitted
+            min_calibration_frames: Held-out frames needed for the fitted temperature to count as calibrated
+        """
+        self.labels = list(labels)
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.processor = AutoProcessor.from_pretrained(model_name)
+        self.model = AutoModel.from_pretrained(model_name).to(self.device).eval()
+        self.model_name = model_name
+        self.temperature = temperature
+        self.min_calibration_frames = min_calibration_frames
+        self.calibrated = False
+
+        cache_path = None
+        if cache_dir is not None:
+            cache_path = os.path.join(cache_dir, f"camera_probe_{self._fingerprint(samples)}.npz")
+        if cache_path is not None and os.path.exists(cache_path):
+            state = np.load(cache_path)
+            self.centroids = state["centroids"]
+            self.temperature = float(state["temperature"])
+            self.calibrated = bool(state["calibrated"]) if "calibrated" in state else False
+        else:
+            self.fit(samples)
+            if cache_path is not None:
+                os.makedirs(cache_dir, exist_ok=True)
+                # Temporary name ending in .npz, so np.savez doesn't append the extension
+                tmp_path = f"{cache_path}.{os.getpid()}.tmp.npz"
+                np.savez(tmp_path, centroids=self.centroids, temperature=self.temperature, calibrated=self.calibrated)
+                os.replace(tmp_path, cache_path)
+
+    def _fingerprint(self, samples: List[Tuple[str, str]]) -> str:
+        digest = hashlib.sha1(self.model_name.encode())
+        for path, label in samples:
+            stat = os.stat(path)
+            digest.update(f"{path}|{label}|{stat.st_mtime_ns}|{stat.st_size}".encode())
+        return digest.hexdigest()[:16]
+
+    @torch.inference_mode()
+    def embed(self, images: List[Image.Image], batch_size: int = 64) -> np.ndarray:
+        """L2-normalized image embeddings, shape (N, D) float32."""
+        embeddings = []
+        for start in range(0, len(images), batch_size):
+            batch = [image.convert("RGB") for image in images[start:start + batch_size]]
+            inputs = self.processor(images=batch, return_tensors="pt").to(self.device)
+            features = self.model.get_image_features(pixel_values=inputs["pixel_values"])
+            features = torch.nn.functional.normalize(features.float(), dim=-1)
+            embeddings.append(features.cpu().numpy())
+        if not embeddings:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.concatenate(embeddings).astype(np.float32)
+
+    def fit(self, samples: List[Tuple[str, str]]):
+        embeddings = self.embed([Image.open(path) for path, _ in samples])
+        targets = np.array([self.labels.index(label) for _, label in samples])
+
+        centroids = np.zeros((len(self.labels), embeddings.shape[1]), dtype=np.float32)
+        for i in range(len(self.labels)):
+            if np.any(targets == i):
+                centroids[i] = embeddings[targets == i].mean(axis=0)
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-8)
+        self.centroids = centroids
+        self.temperature = self._fit_temperature(embeddings, targets)
+
+    def _fit_temperature(self, embeddings: np.ndarray, targets: np.ndarray) -> float:
+        # Leave-one-out similarities: each frame is compared to its class centroid computed without it
+        counts = np.bincount(targets, minlength=len(self.labels))
+        held_out = counts[targets] > 1
+        if not np.any(held_out):
+            return self.temperature
+        self.calibrated = int(np.count_nonzero(held_out)) >= self.min_calibration_frames
+
+        sums = np.zeros_like(self.centroids)
+        np.add.at(sums, targets, embeddings)
+        sims = embeddings[held_out] @ self.centroids.T
+        own = sums[targets[held_out]] - embeddings[held_out]
+        own /= np.maximum(np.linalg.norm(own, axis=1, keepdims=True), 1e-8)
+        rows = np.arange(len(sims))
+        sims[rows, targets[held_out]] = np.sum(embeddings[held_out] * own, axis=1)
+
+        best_t, best_nll = self.temperature, np.inf
+        for t in np.logspace(-3, 0, 61):
+            logits = sims / t
+            logits -= logits.max(axis=1, keepdims=True)
+            log_probs = logits - np.log(np.exp(logits).sum(axis=1, keepdims=True))
+            nll = -log_probs[rows, targets[held_out]].mean()
+            if nll < best_nll:
+                best_t, best_nll = float(t), nll
+        return best_t
+
+    def predict_proba(self, images: List[Image.Image]) -> np.ndarray:
+        """Calibrated class probabilities, shape (N, num_labels)."""
+        logits = self.embed(images) @ self.centroids.T / self.temperature
+        logits -= logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        return probs / probs.sum(axis=1, keepdims=True)
+
+    def predict(self, images: List[Image.Image]) -> List[Tuple[str, float]]:
+        """Most likely camera position and its confidence for each image."""
+        probs = self.predict_proba(images)
+        best = probs.argmax(axis=1)
+        return [(self.labels[i], float(p[i])) for i, p in zip(best, probs)]
@@ -0,0 +1,215 @@
+import os
+import re
+import hashlib
+import itertools
+import subprocess
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import cv2
+from project_path import PROJECT_PATH
+
+
+RESOLVED_CLIP_DIR = f"{PROJECT_PATH}/log/clip_tmp/refs" # Cuts of clip references for tools that need a file
+RESOLVED_CLIP_MAX_BYTES = 5 * 1024 ** 3 # Least recently used cuts are deleted beyond this size
+
+
+class ClipRef(NamedTuple):
+    """
+    A time range of a video file, used instead of cutting the range out into its own file.
+
+    Serialized as a media fragment, e.g. "/data/match.mp4#t=12.480,17.920", so it can be passed
+    around as a material path and parsed back by the tools reading videos.
+    """
+    path: str
+    start: float = 0.0
+    end: Optional[float] = None
+
+    def __str__(self):
+        if self.end is None:
+            return self.path if self.start == 0 else f"{self.path}#t={self.start:.3f}"
+        return f"{self.path}#t={self.start:.3f},{self.end:.3f}"
+
+
+_FRAGMENT = re.compile(r"^(.*)#t=([\d.]+)(?:,([\d.]+))?$")
+
+
+def parse_clip_ref(material: str) -> ClipRef:
+    """Split a material path into file path and time range, a plain path covers the whole video."""
+    match = _FRAGMENT.match(material)
+    if not match:
+        return ClipRef(material)
+    end = float(match.group(3)) if match.group(3) else None
+    return ClipRef(match.group(1), float(match.group(2)), end)
+
+
+def clip_frame_range(cap, ref: ClipRef) -> Tuple[int, int]:
+    """
+    First and last (exclusive) frame index of the clip in an opened cv2 capture.
+
+    Without an end time the last index comes from CAP_PROP_FRAME_COUNT, which is only an estimate
+    and can be 0 for some containers, so readers of whole videos must read until EOF instead.
+    With an end time and no usable frame count, the end time alone bounds the clip.
+    """
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    start = int(round(ref.start * fps))
+    if ref.end is None:
+        return start, total_frames
+    end = int(round(ref.end * fps))
+    if total_frames > 0:
+        end = min(total_frames, end)
+    return start, end
+
+
+def iter_clip_frames(material: str, stride: int = 1) -> Iterator[Tuple[int, "cv2.Mat"]]:
+    """
+    Decode the BGR frames of a video or clip reference.
+
+    Args:
+        material: Video path, optionally with a "#t=start,end" fragment
+        stride: Keep every stride-th frame, counted from the clip start
+
+    Yields:
+        (frame index in the source video, frame)
+    """
+    ref = parse_clip_ref(material)
+    cap = cv2.VideoCapture(ref.path)
+    if not cap.isOpened():
+        raise ValueError(f"Cannot open video: {ref.path}")
+    try:
+        start, end = clip_frame_range(cap, ref)
+        if start > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        # Whole videos are read until EOF, their frame count is only an estimate
+        indices = itertools.count(start) if ref.end is None else range(start, end)
+        for index in indices:
+            if (index - start + 1) % stride != 0:
+                if not cap.grab():
+                    break
+                continue
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield index, frame
+    finally:
+        cap.release()
+
+
+def clip_frame_indices(material: str, stride: int = 1) -> List[int]:
+    """Source frame indices iter_clip_frames would yield for the same material and stride."""
+    ref = parse_clip_ref(material)
+    cap = cv2.VideoCapture(ref.path)
+    if not cap.isOpened():
+        raise ValueError(f"Cannot open video: {ref.path}")
+    start, end = clip_frame_range(cap, ref)
+    if int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) <= 0 or (ref.end is None and end <= start):
+        # No usable frame count, count the frames by grabbing them, up to the clip end if any
+        limit = end if ref.end is not None else None
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        end = start
+        while (limit is None or end < limit) and cap.grab():
+            end += 1
+    cap.release()
+    return list(range(start + stride - 1, end, stride))
+
+
+def read_frames_at(material: str, indices: List[int], max_skip: int = 30) -> Dict[int, "cv2.Mat"]:
+    """
+    Decode selected BGR frames of a video.
+
+    Indices are visited in order, frames closer than max_skip are reached by grabbing, farther ones by seeking.
+
+    Returns:
+        {frame index: frame} for the frames that could be read
+    """
+    ref = parse_clip_ref(material)
+    cap = cv2.VideoCapture(ref.path)
+    if not cap.isOpened():
+        raise ValueError(f"Cannot open video: {ref.path}")
+    frames = {}
+    position = 0
+    try:
+        for index in sorted(set(indices)):
+            if index < position or index - position > max_skip:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+            else:
+                while position < index and cap.grab():
+                    position += 1
+            ret, frame = cap.read()
+            position = index + 1
+            if ret:
+                frames[index] = frame
+    finally:
+        cap.release()
+    return frames
+
+
+def cut_stream_copy(ref: ClipRef, output_path: str):
+    """
+    Write the clip to its own file without re-encoding.
+
+    The cut snaps to the keyframe at or before the clip start, so the file may begin slightly early.
+    """
+    command = ["ffmpeg", "-loglevel", "error", "-ss", f"{ref.start:.3f}", "-i", ref.path]
+    if ref.end is not None:
+        command += ["-t", f"{ref.end - ref.start:.3f}"]
+    command += ["-c", "copy", "-map", "0", "-avoid_negative_ts", "make_zero", "-y", output_path]
+    subprocess.run(command, check=True)
+
+
+def cut_encode(ref: ClipRef, output_path: str):
+    """Write the clip to its own file, re-encoded so it starts and ends on the exact frames."""
+    command = ["ffmpeg", "-loglevel", "error", "-ss", f"{ref.start:.3f}", "-i", ref.path]
+    if ref.end is not None:
+        command += ["-t", f"{ref.end - ref.start:.3f}"]
+    command += ["-c:v", "libx264", "-preset", "ultrafast", "-crf", "18", "-c:a", "aac", "-y", output_path]
+    subprocess.run(command, check=True)
+
+
+def _trim_cache_dir(cache_dir: str, max_bytes: int, keep: str):
+    """Delete the least recently used finished cuts of cache_dir until it fits max_bytes, never keep."""
+    entries = []
+    for file in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, file)
+        if file.endswith(".tmp.mp4") or path == keep:
+            continue
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, path, stat.st_size))
+    total = sum(size for _, _, size in entries) + os.path.getsize(keep)
+    for _, path, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def resolve_clip(material: str, cache_dir: str = RESOLVED_CLIP_DIR, max_bytes: int = RESOLVED_CLIP_MAX_BYTES) -> str:
+    """
+    A path that tools opening the file themselves can use.
+
+    Plain paths are returned unchanged. A clip reference is cut to its own file once, and the cut
+    is reused while the source video is unchanged. Cuts are touched when reused, and the least
+    recently used ones are deleted once cache_dir outgrows max_bytes.
+    """
+    ref = parse_clip_ref(material)
+    if ref.start == 0 and ref.end is None:
+        return ref.path
+    stat = os.stat(ref.path)
+    digest = hashlib.sha1(f"{os.path.abspath(ref.path)}|{stat.st_mtime_ns}|{ref.start:.3f}|{ref.end}".encode()).hexdigest()[:16]
+    output_path = os.path.join(cache_dir, f"{os.path.splitext(os.path.basename(ref.path))[0]}_{digest}.mp4")
+    if not os.path.exists(output_path):
+        os.makedirs(cache_dir, exist_ok=True)
+        # Cut under a temporary name so a concurrent call never opens a partial file
+        tmp_path = f"{output_path}.{os.getpid()}.tmp.mp4"
+        cut_encode(ref, tmp_path)
+        os.replace(tmp_path, output_path)
+        _trim_cache_dir(cache_dir, max_bytes, keep=output_path)
+    else:
+        os.utime(output_path)
+    return output_path
@@ -0,0 +1,136 @@
+import os
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .clip_ref import parse_clip_ref, iter_clip_frames
+from .scoreboard_ocr import ScoreboardOCR, parse_scoreboard
+
+
+def roi_hash(crop, size=(32, 8)):
+    """Average hash of a scoreboard crop, as a flat boolean array."""
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+    return (small > small.mean()).ravel()
+
+
+class ClockTrack:
+    """
+    Game clock and score over a clip, fitted from sparse scoreboard readings.
+
+    The broadcast clock runs at real time, so game clock = video time + offset. The offset is the
+    median over all readings, and readings more than `tolerance` seconds away from it, or breaking
+    monotonicity, are dropped as misreads before averaging.
+    """
+
+    def __init__(self, readings: List[Dict], tolerance: float = 2.0):
+        """
+        Args:
+            readings: parse_scoreboard results, each with an extra "time" key (seconds in the source video)
+            tolerance: Largest residual in seconds for a clock reading to count as an inlier
+        """
+        self.readings = readings
+        clocks = [(r["time"], r["clock"][0] * 60 + r["clock"][1]) for r in readings if r["clock"]]
+        self.offset = None
+        self.inliers = []
+        if clocks:
+            median = float(np.median([c - t for t, c in clocks]))
+            inliers = [(t, c) for t, c in clocks if abs(c - t - median) <= tolerance]
+            monotonic = [inliers[0]]
+            for t, c in inliers[1:]:
+                if c >= monotonic[-1][1]:
+                    monotonic.append((t, c))
+            self.inliers = monotonic
+            self.offset = float(np.mean([c - t for t, c in monotonic]))
+
+        scores = [r["score"] for r in readings if r["score"]]
+        self.score = Counter(scores).most_common(1)[0][0] if scores else None
+        teams = [tuple(r["teams"]) for r in readings if len(r["teams"]) == 2]
+        self.teams = list(Counter(teams).most_common(1)[0][0]) if teams else []
+
+    def confidence(self, min_readings: int = 3) -> float:
+        """
+        Agreement of the readings with the fitted track, 0 when too few clocks or no score were read.
+
+        The smaller of the clock inlier fraction and the fraction of score readings equal to the
+        most frequent score.
+        """
+        clocks = [r for r in self.readings if r["clock"]]
+        scores = [r["score"] for r in self.readings if r["score"]]
+        if len(self.inliers) < min_readings or not scores:
+            return 0.0
+        return min(len(self.inliers) / len(clocks), scores.count(self.score) / len(scores))
+
+    def clock_at(self, time: float) -> Optional[Tuple[int, int]]:
+        """(minutes, seconds) on the game clock at a time of the source video."""
+        if self.offset is None:
+            return None
+        total = max(0, int(round(time + self.offset)))
+        return total // 60, total % 60
+
+    def score_at(self, time: float) -> Optional[Tuple[int, int]]:
+        """Last score read at or before the given time, else the clip's most frequent score."""
+        before = [r for r in self.readings if r["score"] and r["time"] <= time]
+        return before[-1]["score"] if before else self.score
+
+
+class ClockTracker:
+    """
+    Streams a clip at low fps through the scoreboard OCR.
+
+    Only crops whose hash changed since the last OCR'd crop are read again, and finished
+    tracks are cached by file, modification time and clip range.
+    """
+
+    def __init__(self, ocr: ScoreboardOCR, sample_fps: float = 1.0, hash_tolerance: int = 2, cache_size: int = 64):
+        """
+        Args:
+            ocr: Scoreboard OCR holding the per-layout regions
+            sample_fps: Frames per second of video looked at
+            hash_tolerance: Crops whose hash differs in at most this many bits are not OCR'd again
+            cache_size: Number of tracks kept in memory
+        """
+        self.ocr = ocr
+        self.sample_fps = sample_fps
+        self.hash_tolerance = hash_tolerance
+        self.cache_size = cache_size
+        self._cache = {}
+
+    def track(self, material: str, layout_key: Optional[str] = None) -> ClockTrack:
+        ref = parse_clip_ref(material)
+        key = (os.path.abspath(ref.path), os.path.getmtime(ref.path), ref.start, ref.end, self.sample_fps)
+        if key in self._cache:
+            return self._cache[key]
+
+        cap = cv2.VideoCapture(ref.path)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        cap.release()
+        stride = max(1, int(round(fps / self.sample_fps)))
+
+        readings = []
+        last_hash, last_reading = None, None
+        for index, frame in iter_clip_frames(material, stride):
+            if layout_key is None:
+                layout_key = f"{os.path.dirname(os.path.abspath(ref.path))}|{frame.shape[1]}x{frame.shape[0]}"
+            crop = self.ocr.crop(frame, layout_key)
+            crop_hash = roi_hash(crop) if crop is not None and crop.size else None
+            if crop_hash is not None and last_hash is not None and np.count_nonzero(crop_hash != last_hash) <= self.hash_tolerance:
+                reading = dict(last_reading)
+                # An unchanged crop means the clock shows the same value, it is not a new clock sample
+                reading["clock"] = None
+            else:
+                results = self.ocr.read(frame, layout_key) or []
+                reading = parse_scoreboard(results)
+                crop = self.ocr.crop(frame, layout_key)
+                last_hash = roi_hash(crop) if crop is not None and crop.size else None
+                last_reading = reading
+            reading["time"] = index / fps
+            readings.append(reading)
+
+        track = ClockTrack(readings)
+        if len(self._cache) >= self.cache_size:
+            self._cache.pop(next(iter(self._cache)))
+        self._cache[key] = track
+        return track
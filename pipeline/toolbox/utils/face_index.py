@@ -0,0 +1,214 @@
+import os
+import json
+import pickle
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+
+class FaceIndex:
+    """
+    Face encodings held as one contiguous float32 (N, 128) matrix with a parallel name array.
+
+    A query is matched with a single vectorized distance computation and an argpartition top-k.
+    Libraries of ann_threshold rows or more are searched through an HNSW index instead when
+    hnswlib is installed. A player may own several rows, and results are deduplicated by name.
+    """
+
+    def __init__(self, encodings: np.ndarray, names: np.ndarray, ann_threshold: int = 100000):
+        """
+        Args:
+            encodings: (N, 128) face encodings
+            names: (N,) person name of every row
+            ann_threshold: Number of rows from which the HNSW index is used
+        """
+        self.encodings = np.ascontiguousarray(encodings, dtype=np.float32)
+        self.names = np.asarray(names)
+        self.sq_norms = np.einsum('ij,ij->i', self.encodings, self.encodings)
+        self.ann = None
+        if hnswlib is not None and len(self.encodings) >= ann_threshold:
+            self.ann = hnswlib.Index(space='l2', dim=self.encodings.shape[1])
+            self.ann.init_index(max_elements=len(self.encodings), ef_construction=200, M=16)
+            self.ann.add_items(self.encodings, np.arange(len(self.encodings)))
+            self.ann.set_ef(128)
+
+    @classmethod
+    def from_library(cls, face_library: Dict[str, np.ndarray], **kwargs) -> "FaceIndex":
+        """Build from a {name: encoding} dict, as stored in face_library.pkl."""
+        names = list(face_library.keys())
+        encodings = np.stack([face_library[name] for name in names]) if names else np.zeros((0, 128), dtype=np.float32)
+        return cls(encodings, np.array(names, dtype=object), **kwargs)
+
+    @classmethod
+    def from_store(cls, index_dir: str, **kwargs) -> "FaceIndex":
+        """Build from the live rows of a FaceIndexStore directory."""
+        store = FaceIndexStore(index_dir)
+        encodings, names = store.load()
+        return cls(encodings, names, **kwargs)
+
+    @classmethod
+    def from_pickle(cls, filename: str, **kwargs) -> "FaceIndex":
+        with open(filename, 'rb') as f:
+            return cls.from_library(pickle.load(f), **kwargs)
+
+    def __len__(self):
+        return len(self.encodings)
+
+    def search(self, encoding: np.ndarray, k: int = 5) -> List[Tuple[str, float]]:
+        """
+        The k closest persons to a face encoding.
+
+        Returns:
+            (name, euclidean distance) pairs sorted by distance, one per person
+        """
+        if len(self) == 0:
+            return []
+        query = np.asarray(encoding, dtype=np.float32)
+        # Extra candidates leave room for several rows of the same person
+        candidates = min(len(self), k * 4)
+
+        if self.ann is not None:
+            rows, sq_dists = self.ann.knn_query(query, k=candidates)
+            rows, sq_dists = rows[0], sq_dists[0]
+        else:
+            sq_dists = self.sq_norms - 2.0 * (self.encodings @ query) + float(query @ query)
+            rows = np.argpartition(sq_dists, candidates - 1)[:candidates]
+            sq_dists = sq_dists[rows]
+            order = np.argsort(sq_dists)
+            rows, sq_dists = rows[order], sq_dists[order]
+
+        matches, seen = [], set()
+        for row, sq_dist in zip(rows, sq_dists):
+            name = self.names[row]
+            if name in seen:
+                continue
+            seen.add(name)
+            matches.append((name, float(np.sqrt(max(sq_dist, 0.0)))))
+            if len(matches) == k:
+                break
+        return matches
+
+
+class FaceIndexStore:
+    """
+    Append-friendly on-disk face index.
+
+    Layout of the index directory:
+        encodings.f32   raw float32 rows of 128 values, only ever appended
+        rows.jsonl      one {"name", "image"} line per row, appended in lockstep
+        manifest.json   per player the image signatures and owned rows, the dead rows, the committed row count
+                        and the generation of the data files
+
+    Refreshing a player appends its new rows and marks the old ones dead. Rows written after the
+    last committed manifest (e.g. by an interrupted build) are truncated on the next open.
+    compact() writes the live rows to data files of the next generation (encodings.<n>.f32,
+    rows.<n>.jsonl) and switches to them by committing the manifest, so an interrupted compaction
+    leaves the index as it was.
+    """
+
+    DIM = 128
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        self.manifest_path = os.path.join(index_dir, "manifest.json")
+        self.manifest = {"num_rows": 0, "dead_rows": [], "players": {}, "generation": 0}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r') as f:
+                self.manifest = json.load(f)
+        self.encodings_path, self.rows_path = self._data_paths(self.manifest.get("generation", 0))
+
+    def _data_paths(self, generation: int) -> Tuple[str, str]:
+        suffix = f".{generation}" if generation else ""
+        return (os.path.join(self.index_dir, f"encodings{suffix}.f32"),
+                os.path.join(self.index_dir, f"rows{suffix}.jsonl"))
+
+    def exists(self) -> bool:
+        return os.path.exists(self.manifest_path)
+
+    def _truncate_uncommitted(self):
+        num_rows = self.manifest["num_rows"]
+        os.makedirs(self.index_dir, exist_ok=True)
+        with open(self.encodings_path, 'ab') as f:
+            f.truncate(num_rows * self.DIM * 4)
+        lines = []
+        if os.path.exists(self.rows_path):
+            with open(self.rows_path, 'r') as f:
+                lines = f.readlines()[:num_rows]
+        with open(self.rows_path, 'w') as f:
+            f.writelines(lines)
+
+    def signature(self, player: str):
+        return self.manifest["players"].get(player, {}).get("signature")
+
+    def players(self) -> List[str]:
+        return list(self.manifest["players"].keys())
+
+    def remove(self, player: str):
+        entry = self.manifest["players"].pop(player, None)
+        if entry:
+            self.manifest["dead_rows"].extend(entry["rows"])
+
+    def put(self, player: str, signature, encodings: List[np.ndarray], images: List[str]):
+        """Replace the rows of a player, appending the new encodings to the binary file."""
+        self.remove(player)
+        start = self.manifest["num_rows"]
+        with open(self.encodings_path, 'ab') as f:
+            for encoding in encodings:
+                f.write(np.asarray(encoding, dtype=np.float32).tobytes())
+        with open(self.rows_path, 'a') as f:
+            for image in images:
+                f.write(json.dumps({"name": player, "image": image}) + "\n")
+        self.manifest["num_rows"] = start + len(encodings)
+        self.manifest["players"][player] = {"signature": signature, "rows": list(range(start, start + len(encodings)))}
+
+    def commit(self):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def open_for_append(self):
+        self._truncate_uncommitted()
+
+    def load(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(encodings, names) of the live committed rows."""
+        num_rows = self.manifest["num_rows"]
+        encodings = np.fromfile(self.encodings_path, dtype=np.float32, count=num_rows * self.DIM).reshape(-1, self.DIM)
+        with open(self.rows_path, 'r') as f:
+            names = [json.loads(line)["name"] for _, line in zip(range(num_rows), f)]
+        live = np.ones(num_rows, dtype=bool)
+        live[self.manifest["dead_rows"]] = False
+        return encodings[live], np.array(names, dtype=object)[live]
+
+    def compact(self):
+        """Rewrite the index without dead rows, into the data files of the next generation."""
+        encodings = np.fromfile(self.encodings_path, dtype=np.float32, count=self.manifest["num_rows"] * self.DIM).reshape(-1, self.DIM)
+        with open(self.rows_path, 'r') as f:
+            rows = f.readlines()[:self.manifest["num_rows"]]
+        players, new_encodings, new_rows = {}, [], []
+        for player, entry in self.manifest["players"].items():
+            start = len(new_rows)
+            new_encodings.extend(encodings[entry["rows"]])
+            new_rows.extend(rows[i] for i in entry["rows"])
+            players[player] = {"signature": entry["signature"], "rows": list(range(start, len(new_rows)))}
+        generation = self.manifest.get("generation", 0) + 1
+        encodings_path, rows_path = self._data_paths(generation)
+        np.asarray(new_encodings, dtype=np.float32).reshape(-1, self.DIM).tofile(encodings_path + ".tmp")
+        os.replace(encodings_path + ".tmp", encodings_path)
+        with open(rows_path + ".tmp", 'w') as f:
+            f.writelines(new_rows)
+        os.replace(rows_path + ".tmp", rows_path)
+
+        # Committing the manifest switches readers to the new files, the old ones are garbage after it
+        old_paths = (self.encodings_path, self.rows_path)
+        self.manifest = {"num_rows": len(new_rows), "dead_rows": [], "players": players, "generation": generation}
+        self.commit()
+        self.encodings_path, self.rows_path = encodings_path, rows_path
+        for path in old_paths:
+            if os.path.exists(path):
+                os.remove(path)
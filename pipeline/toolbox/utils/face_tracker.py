@@ -0,0 +1,151 @@
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+def box_iou(a: Tuple[int, int, int, int], b: Tuple[int, int, int, int]) -> float:
+    """IoU of two face_recognition boxes (top, right, bottom, left)."""
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    inter = max(0, right - left) * max(0, bottom - top)
+    area_a = (a[1] - a[3]) * (a[2] - a[0])
+    area_b = (b[1] - b[3]) * (b[2] - b[0])
+    union = area_a + area_b - inter
+    return inter / union if union > 0 else 0.0
+
+
+class FaceTrack:
+    """Detections of one face across sampled frames, with the few encodings taken of it."""
+
+    def __init__(self, track_id: int, frame_index: int, box):
+        self.track_id = track_id
+        self.first_frame = frame_index
+        self.last_frame = frame_index
+        self.box = box
+        self.hits = 1
+        self.misses = 0
+        self.encodings = []
+        self.last_encoded = None
+
+    def mean_encoding(self) -> Optional[np.ndarray]:
+        return np.mean(self.encodings, axis=0) if self.encodings else None
+
+
+class FaceTracker:
+    """
+    Associates face boxes of consecutive sampled frames into tracks.
+
+    Boxes are matched greedily to the live tracks by IoU. A box left unmatched is compared by
+    encoding with the tracks lost in the last max_age frames before it opens a new track, which
+    reattaches faces after a short occlusion or a missed detection.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_age: int = 5, reid_distance: float = 0.45,
+                 encodings_per_track: int = 3, encode_interval: int = 5):
+        """
+        Args:
+            iou_threshold: Smallest IoU for a box to continue a track
+            max_age: Sampled frames a track survives without a detection
+            reid_distance: Largest encoding distance for an unmatched box to rejoin a lost track
+            encodings_per_track: Encodings taken per track, later detections are not encoded
+            encode_interval: Sampled frames between two encodings of the same track
+        """
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.reid_distance = reid_distance
+        self.encodings_per_track = encodings_per_track
+        self.encode_interval = encode_interval
+        self.tracks: List[FaceTrack] = []
+        self._step = 0
+
+    def _live(self) -> List[FaceTrack]:
+        return [track for track in self.tracks if track.misses <= self.max_age]
+
+    def associate(self, boxes: List[Tuple[int, int, int, int]]) -> List[Optional[FaceTrack]]:
+        """Match the boxes of a new frame to live tracks by IoU, None for the unmatched ones."""
+        self._step += 1
+        live = self._live()
+        pairs = sorted(((box_iou(box, track.box), i, j) for i, box in enumerate(boxes) for j, track in enumerate(live)), reverse=True)
+        assigned: List[Optional[FaceTrack]] = [None] * len(boxes)
+        used = set()
+        for iou, i, j in pairs:
+            if iou < self.iou_threshold:
+                break
+            if assigned[i] is not None or j in used:
+                continue
+            assigned[i] = live[j]
+            used.add(j)
+        return assigned
+
+    def needs_encoding(self, track: Optional[FaceTrack]) -> bool:
+        if track is None:
+            return True
+        if len(track.encodings) >= self.encodings_per_track:
+            return False
+        return track.last_encoded is None or self._step - track.last_encoded >= self.encode_interval
+
+    def update(self, frame_index: int, boxes: List, assigned: List[Optional[FaceTrack]], encodings: Dict[int, np.ndarray]):
+        """
+        Commit the detections of a frame.
+
+        Args:
+            frame_index: Source frame index
+            boxes: Face boxes of the frame
+            assigned: Output of associate for the same boxes
+            encodings: {box position: encoding} for the boxes that were encoded
+        """
+        # Tracks continued by IoU in this frame can't be taken over by re-identification
+        matched = {track.track_id for track in assigned if track is not None}
+        for i, (box, track) in enumerate(zip(boxes, assigned)):
+            encoding = encodings.get(i)
+            if track is None and encoding is not None:
+                track = self._reidentify(encoding, matched)
+            if track is None:
+                track = FaceTrack(len(self.tracks), frame_index, box)
+                self.tracks.append(track)
+            else:
+                track.hits += 1
+            track.box = box
+            track.last_frame = frame_index
+            track.misses = 0
+            if encoding is not None and len(track.encodings) < self.encodings_per_track:
+                track.encodings.append(encoding)
+                track.last_encoded = self._step
+            matched.add(track.track_id)
+
+        for track in self.tracks:
+            if track.track_id not in matched:
+                track.misses += 1
+
+    def _reidentify(self, encoding: np.ndarray, matched) -> Optional[FaceTrack]:
+        best, best_distance = None, self.reid_distance
+        for track in self._live():
+            if track.track_id in matched or not track.encodings:
+                continue
+            distance = float(np.linalg.norm(track.mean_encoding() - encoding))
+            if distance < best_distance:
+                best, best_distance = track, distance
+        return best
+
+
+def vote_identity(matches: List[List[Tuple[str, float]]], tolerance: float = 0.6):
+    """
+    Aggregate the index matches of a track's encodings.
+
+    Every match within tolerance votes for its name with weight tolerance - distance.
+
+    Returns:
+        (name, mean distance of the name's matches, share of the vote weight), or None when nothing is within tolerance
+    """
+    weights = defaultdict(float)
+    distances = defaultdict(list)
+    for encoding_matches in matches:
+        for name, distance in encoding_matches:
+            if distance < tolerance:
+                weights[name] += tolerance - distance
+                distances[name].append(distance)
+    if not weights:
+        return None
+    name = max(weights, key=weights.get)
+    return name, float(np.mean(distances[name])), weights[name] / sum(weights.values())
@@ -0,0 +1,96 @@
+import sys
+from typing import Dict, List, Union
+
+import numpy as np
+import torch
+from PIL import Image, ImageDraw
+from project_path import PROJECT_PATH
+sys.path.append(f"{PROJECT_PATH}/pipeline/toolbox/utils/GroundingDINO")
+import groundingdino.datasets.transforms as T
+from groundingdino.util.inference import load_model
+from groundingdino.util.utils import get_phrases_from_posmap
+
+
+class GroundingDetector:
+    """
+    GroundingDINO loaded once and kept resident, detecting a text prompt on batches of frames.
+    """
+
+    def __init__(self, config_file, model_weights, device=None, box_threshold=0.3, text_threshold=0.25):
+        """
+        Args:
+            config_file: GroundingDINO model config
+            model_weights: GroundingDINO checkpoint
+            device: Torch device, defaults to cuda when available
+            box_threshold: Minimum box score to keep a detection
+            text_threshold: Minimum token score for a token to be part of the predicted phrase
+        """
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.model = load_model(config_file, model_weights, device=self.device).eval()
+        self.box_threshold = box_threshold
+        self.text_threshold = text_threshold
+        self.transform = T.Compose([
+            T.RandomResize([800], max_size=1333),
+            T.ToTensor(),
+            T.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]),
+        ])
+
+    @staticmethod
+    def _to_pil(frame: Union[Image.Image, np.ndarray]) -> Image.Image:
+        # Arrays are RGB, as returned by cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        return frame.convert("RGB") if isinstance(frame, Image.Image) else Image.fromarray(frame)
+
+    @torch.no_grad()
+    def detect(self, frames: List[Union[Image.Image, np.ndarray]], text: str, batch_size: int = 8) -> List[Dict]:
+        """
+        Detect the objects described by text on every frame.
+
+        Args:
+            frames: PIL images or RGB arrays
+            text: Text prompt
+            batch_size: Frames per forward pass
+
+        Returns:
+            One prediction per frame: {"boxes": (N, 4) normalized cxcywh, "scores": [N], "labels": [N], "size": [H, W]}
+        """
+        caption = text.lower().strip()
+        if not caption.endswith("."):
+            caption = caption + "."
+        tokenizer = self.model.tokenizer
+        tokenized = tokenizer(caption)
+
+        predictions = []
+        for start in range(0, len(frames), batch_size):
+            images = [self._to_pil(frame) for frame in frames[start:start + batch_size]]
+            tensors = [self.transform(image, None)[0].to(self.device) for image in images]
+            outputs = self.model(tensors, captions=[caption] * len(tensors))
+            logits_batch = outputs["pred_logits"].sigmoid().cpu()
+            boxes_batch = outputs["pred_boxes"].cpu()
+
+            for image, logits, boxes in zip(images, logits_batch, boxes_batch):
+                keep = logits.max(dim=1)[0] > self.box_threshold
+                logits, boxes = logits[keep], boxes[keep]
+                labels = [get_phrases_from_posmap(logit > self.text_threshold, tokenized, tokenizer) for logit in logits]
+                predictions.append({
+                    "boxes": boxes,
+                    "scores": logits.max(dim=1)[0].tolist(),
+                    "labels": labels,
+                    "size": [image.height, image.width],
+                })
+        return predictions
+
+    def draw(self, frame: Union[Image.Image, np.ndarray], prediction: Dict, output_file: str):
+        """Save the frame with the predicted boxes and phrases drawn on it."""
+        image = self._to_pil(frame).copy()
+        H, W = prediction["size"]
+        draw = ImageDraw.Draw(image)
+        for box, label, score in zip(prediction["boxes"], prediction["labels"], prediction["scores"]):
+            cx, cy, w, h = (box * torch.tensor([W, H, W, H])).tolist()
+            x0, y0, x1, y1 = cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2
+            color = tuple(np.random.randint(0, 255, size=3).tolist())
+            draw.rectangle([x0, y0, x1, y1], outline=color, width=6)
+            caption = f"{label}({score:.2f})"
+            text_box = draw.textbbox((x0, y0), caption)
+            draw.rectangle(text_box, fill=color)
+            draw.text((x0, y0), caption, fill="white")
+        image.save(output_file)
@@ -1,3 +1,7 @@
+import os
+import math
+import itertools
+from collections import deque
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -5,9 +9,40 @@ from torchvision import models, transforms
 from PIL import Image
 import pandas as pd
 import numpy as np
-from transformers import Qwen2_5_VLForConditionalGeneration, AutoTokenizer, AutoProcessor
+from transformers import Qwen2_5_VLForConditionalGeneration, AutoTokenizer, AutoProcessor, LogitsProcessor, LogitsProcessorList
 from qwen_vl_utils import process_vision_info
 from torch.backends import cudnn
+from concurrent.futures import ThreadPoolExecutor
+
+def load_crop(path):
+    with Image.open(path) as img:
+        return img.convert("RGB")
+
+
+def iter_crops(paths, num_workers=4, prefetch=64):
+    """Decode image files in order in a thread pool, keeping at most prefetch crops decoded ahead."""
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        pending = deque()
+        for path in paths:
+            pending.append(pool.submit(load_crop, path))
+            if len(pending) >= prefetch:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class LazyCrops():
+    """Sequence of image files decoded on access, standing in for a list of crops in a batch."""
+
+    def __init__(self, paths):
+        self.paths = list(paths)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, idx):
+        return load_crop(self.paths[idx])
+
 
 class LegibilityClassifier34(nn.Module):
     def __init__(self, train=False,  finetune=False):
@@ -28,8 +63,16 @@ class LegibilityClassifier34(nn.Module):
 
 
 class Legibility():
-    def __init__(self, legibility_model_path, device):
-        self.device = device
+    def __init__(self, legibility_model_path, device, batch_size=32, num_workers=4):
+        """
+        Args:
+            legibility_model_path: ResNet34 legibility checkpoint
+            device: Torch device
+            batch_size: Crops per forward pass
+            num_workers: Threads running the PIL transforms
+        """
+        self.device = torch.device(device)
+        self.batch_size = batch_size
         cudnn.benchmark = True
 
         # Initialize transforms
@@ -38,6 +81,8 @@ class Legibility():
             transforms.ToTensor(),
             transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
         ])
+        self.pool = ThreadPoolExecutor(max_workers=num_workers)
+        self.prefetch = ThreadPoolExecutor(max_workers=1)
 
         # Initialize model
         self.model = LegibilityClassifier34()
@@ -48,25 +93,211 @@ class Legibility():
         self.model = self.model.to(device)
         self.model.eval()
 
+        self.pinned = None
+        if self.device.type == "cuda":
+            # Staging buffer for asynchronous host to device copies of each micro-batch
+            self.pinned = torch.empty((batch_size, 3, 256, 256), dtype=torch.float32).pin_memory()
+        else:
+            self.model = self.model.to(memory_format=torch.channels_last)
+
+    def _transform_chunk(self, images):
+        images = list(images)
+        if not images:
+            return None
+        return torch.stack(list(self.pool.map(self.transforms, images)))
+
+    def _forward(self, chunk):
+        if self.pinned is not None:
+            n = len(chunk)
+            self.pinned[:n].copy_(chunk)
+            inputs = self.pinned[:n].to(self.device, non_blocking=True)
+        else:
+            inputs = chunk.contiguous(memory_format=torch.channels_last)
+        return self.model(inputs)[:, 0].float().cpu()
+
     @torch.no_grad()
     def process(self, image_list, threshold=0.5):
-        img_crops_PIL = image_list
-        img_crops_PIL_transformed = [self.transforms(img_crop_PIL) for img_crop_PIL in img_crops_PIL]
-        img_crops_PIL_transformed = torch.stack(img_crops_PIL_transformed).to(self.device)
+        """
+        Legibility score of every crop.
+
+        image_list may be any iterable, e.g. the lazy iter_crops loader. Crops are pulled and
+        transformed by the thread pool one micro-batch ahead of the forward pass, so memory stays
+        bounded by batch_size however long the tracklet is.
+        """
+        iterator = iter(image_list)
+
+        def next_chunk():
+            return self._transform_chunk(itertools.islice(iterator, self.batch_size))
+
+        outputs = []
+        pending = self.prefetch.submit(next_chunk)
+        while True:
+            chunk = pending.result()
+            if chunk is None:
+                break
+            pending = self.prefetch.submit(next_chunk)
+            outputs.append(self._forward(chunk))
+        if not outputs:
+            return []
 
         # Get legibility scores
-        outputs = self.model(img_crops_PIL_transformed)
+        outputs = torch.cat(outputs)
         if threshold > 0:
             outputs = (outputs>threshold).float()
-        else:
-            outputs = outputs.float()
-        legibility_scores = outputs[:,0].float().cpu().detach().numpy()
+        legibility_scores = outputs.numpy()
 
         return list(legibility_scores)
 
 
+class DigitRecognizer(nn.Module):
+    """
+    Small CNN reading a jersey number of up to 2 digits from a player crop.
+
+    A shared convolutional trunk feeds three heads: the number of digits (0 when no number is
+    visible, 1 or 2) and the class of the first and second digit. It reads 128x64 crops,
+    normalized with the ImageNet statistics.
+
+    Checkpoints are plain state dicts of this module, as written by train_digit_recognizer.py:
+        trunk.*          4 blocks of Conv2d(3x3, no bias) / BatchNorm2d / ReLU / MaxPool2d, widths width..4*width
+        fc.0             Linear(4*width*8, 256)
+        length_head      Linear(256, 3), logits of 0, 1 or 2 digits
+        digit_heads.0/1  Linear(256, 10), logits of the first and second digit
+    """
+
+    def __init__(self, width=32):
+        super().__init__()
+        layers = []
+        channels = [3, width, width * 2, width * 4, width * 4]
+        for c_in, c_out in zip(channels[:-1], channels[1:]):
+            layers += [nn.Conv2d(c_in, c_out, 3, padding=1, bias=False), nn.BatchNorm2d(c_out), nn.ReLU(inplace=True), nn.MaxPool2d(2)]
+        self.trunk = nn.Sequential(*layers, nn.AdaptiveAvgPool2d((4, 2)), nn.Flatten())
+        self.fc = nn.Sequential(nn.Linear(channels[-1] * 8, 256), nn.ReLU(inplace=True), nn.Dropout(0.2))
+        self.length_head = nn.Linear(256, 3)
+        self.digit_heads = nn.ModuleList([nn.Linear(256, 10), nn.Linear(256, 10)])
+
+    def forward(self, x):
+        x = self.fc(self.trunk(x))
+        return self.length_head(x), self.digit_heads[0](x), self.digit_heads[1](x)
+
+
+class DIGIT_OCR_BATCH():
+    """
+    Jersey number engine built on DigitRecognizer, a drop-in alternative to QWEN2_5VL_OCR_BATCH.
+
+    Writes the same jersey_number_detection / jersey_number_confidence fields. Crops read with a
+    joint probability below min_confidence are left undetected and unprocessed, so a fallback
+    engine can be run on them. Illegible crops are marked processed, they have no number.
+    """
+
+    def __init__(self, digit_model_path, device, min_confidence=0.8, batch_size=256):
+        """
+        Args:
+            digit_model_path: DigitRecognizer state dict, see train_digit_recognizer.py
+            device: Torch device
+            min_confidence: Smallest joint probability of a reading for it to be kept, i.e. the probability of
+                            the predicted digit count times that of each predicted digit. train_digit_recognizer.py
+                            reports the accuracy and coverage of the validation crops at this level
+            batch_size: Crops per forward pass
+        """
+        self.device = torch.device(device)
+        self.min_confidence = min_confidence
+        self.batch_size = batch_size
+        self.use_legibility_filter = True
+        self.transforms = transforms.Compose([
+            transforms.Resize((128, 64)),
+            transforms.ToTensor(),
+            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+        ])
+
+        self.model = DigitRecognizer()
+        self.model.load_state_dict(torch.load(digit_model_path, map_location=device))
+        self.model = self.model.to(device)
+        if self.device.type == "cpu":
+            self.model = self.model.to(memory_format=torch.channels_last)
+        self.model.eval()
+
+    @staticmethod
+    def decode(length_logits, first_logits, second_logits):
+        """(number or None, joint probability) of every crop of a forward pass."""
+        length_p = length_logits.softmax(-1)
+        first_p, first = first_logits.softmax(-1).max(-1)
+        second_p, second = second_logits.softmax(-1).max(-1)
+        readings = []
+        for i in range(len(length_p)):
+            length = int(length_p[i].argmax())
+            if length == 0:
+                readings.append((None, float(length_p[i, 0])))
+            elif length == 1:
+                readings.append((str(int(first[i])), float(length_p[i, 1] * first_p[i])))
+            else:
+                readings.append((f"{int(first[i])}{int(second[i])}", float(length_p[i, 2] * first_p[i] * second_p[i])))
+        return readings
+
+    @torch.no_grad()
+    def process(self, batch, threshold=0.5):
+        real_bs = len(batch['imgs'])
+        jersey_number_detection = [None] * real_bs
+        jersey_number_confidence = [0.0] * real_bs
+        jersey_number_full_detection = [''] * real_bs
+        jersey_number_processed = [False] * real_bs
+
+        idxs = list(range(real_bs))
+        if self.use_legibility_filter:
+            idxs = [i for i, score in enumerate(batch['legibility_score']) if score >= threshold]
+            legible = set(idxs)
+            jersey_number_processed = [i not in legible for i in range(real_bs)]
+
+        for start in range(0, len(idxs), self.batch_size):
+            chunk = idxs[start:start + self.batch_size]
+            inputs = torch.stack([self.transforms(batch['imgs'][i]) for i in chunk]).to(self.device)
+            if self.device.type == "cpu":
+                inputs = inputs.contiguous(memory_format=torch.channels_last)
+            for idx, (number, confidence) in zip(chunk, self.decode(*self.model(inputs))):
+                if confidence < self.min_confidence:
+                    continue
+                jersey_number_detection[idx] = number
+                jersey_number_confidence[idx] = 1.0 if number is not None else 0.0
+                jersey_number_full_detection[idx] = number if number is not None else 'No'
+                jersey_number_processed[idx] = True
+
+        batch['jersey_number_detection'] = jersey_number_detection
+        batch['jersey_number_confidence'] = jersey_number_confidence
+        batch['jersey_number_full_detection'] = jersey_number_full_detection
+        batch['jersey_number_processed'] = jersey_number_processed
+        return batch
+
+
+class JerseyNumberLogitsProcessor(LogitsProcessor):
+    """
+    Restricts generation to the two answers of the jersey prompt: "No", or a number of 1 or 2 digits.
+
+    The first token must be a digit or "No", after "No" or a second digit only EOS is allowed,
+    and after a first digit another digit or EOS.
+    """
+
+    def __init__(self, tokenizer, eos_token_ids, prompt_length, max_digits=2):
+        self.prompt_length = prompt_length
+        self.max_digits = max_digits
+        self.digit_ids = [tokenizer.convert_tokens_to_ids(str(d)) for d in range(10)]
+        self.no_id = tokenizer.encode("No", add_special_tokens=False)[0]
+        self.eos_ids = list(eos_token_ids)
+        self._digits = set(self.digit_ids)
+
+    def __call__(self, input_ids, scores):
+        mask = torch.full_like(scores, float("-inf"))
+        for row, ids in enumerate(input_ids[:, self.prompt_length:].tolist()):
+            if not ids:
+                allowed = self.digit_ids + [self.no_id]
+            elif ids[-1] in self._digits and len(ids) < self.max_digits:
+                allowed = self.digit_ids + self.eos_ids
+            else:
+                allowed = self.eos_ids
+            mask[row, allowed] = 0
+        return scores + mask
+
+
 class QWEN2_5VL_OCR_BATCH():
-    def __init__(self, qwen_model_path, device):
+    def __init__(self, qwen_model_path, device, constrained=True):
         import os
         os.environ["TOKENIZERS_PARALLELISM"] = "false"
         self.model_path = qwen_model_path
@@ -82,6 +313,10 @@ class QWEN2_5VL_OCR_BATCH():
         self.processor = AutoProcessor.from_pretrained(self.model_path)
         self.processor.tokenizer.padding_side = "left"
         self.device = device
+        # Constrained decoding only lets the model answer "No" or a number, in at most 3 tokens
+        self.constrained = constrained
+        eos_token_ids = self.model.generation_config.eos_token_id
+        self.eos_token_ids = eos_token_ids if isinstance(eos_token_ids, list) else [eos_token_ids]
 
         self.text_prompt = "Analyze this image and determine if the player is facing away from the camera. If the player is facing away, output the jersey number on their back. If the player is not facing away from the camera, output 'No'."
 
@@ -89,6 +324,8 @@ class QWEN2_5VL_OCR_BATCH():
         return None, 0
 
     def extract_numbers(self, text):
+        if self.constrained:
+            return text.strip() if text.strip().isdigit() else None
         if text.strip() == "?":
             return None
         number = ''
@@ -97,12 +334,104 @@ class QWEN2_5VL_OCR_BATCH():
                 number += char
         return number if number != '' else None
 
+    def _generate(self, imgs, batch_size):
+        all_generated_text = []
+        num_batches = (len(imgs) + batch_size - 1) // batch_size
+        for i in range(num_batches):
+            batch_start = i * batch_size
+            batch_end = min((i + 1) * batch_size, len(imgs))
+            batch_imgs = imgs[batch_start:batch_end]
+
+            messages = [
+                    [
+                        {
+                            "role": "user", 
+                            "content":[
+                                {
+                                    "type": "image",
+                                    "image": img
+                                }, 
+                                {"type": "text", "text": self.text_prompt}
+                            ]
+                        }
+                    ] for img in batch_imgs
+                ]
+
+            texts = [
+                self.processor.apply_chat_template(msg, tokenize=False, add_generation_prompt=True)
+                for msg in messages
+            ]
+            image_inputs, video_inputs = process_vision_info(messages)
+
+            inputs = self.processor(
+                text=texts,
+                images=image_inputs,
+                videos=video_inputs,
+                padding=True,
+                return_tensors="pt",
+            )
+            inputs = inputs.to(self.device)
+            if self.constrained:
+                logits_processor = LogitsProcessorList([
+                    JerseyNumberLogitsProcessor(self.processor.tokenizer, self.eos_token_ids, inputs.input_ids.shape[1])
+                ])
+                generated_ids = self.model.generate(**inputs, max_new_tokens=3, do_sample=False, logits_processor=logits_processor)
+            else:
+                generated_ids = self.model.generate(**inputs, max_new_tokens=128)
+            generated_ids_trimmed = [
+                out_ids[len(in_ids):] for in_ids, out_ids in zip(inputs.input_ids, generated_ids)
+            ]
+            output_texts = self.processor.batch_decode(
+                generated_ids_trimmed, skip_special_tokens=True, clean_up_tokenization_spaces=False
+            )
+            all_generated_text.extend(output_texts)
+        return all_generated_text
+
+    @staticmethod
+    def budget_order(idxs, scores, budget):
+        """
+        The crops of idxs to OCR under a budget, in order.
+
+        The vote filter only keeps a read confirmed by a neighbouring crop, so crops are picked by
+        windows of 3 consecutive eligible crops, ranked by summed legibility score, rather than
+        one by one. A window shares its crops with the overlapping ones, so picks grow contiguous
+        runs inside the most legible stretches of the tracklet.
+        """
+        eligible = set(idxs)
+        windows = [[j for j in (i - 1, i, i + 1) if j in eligible] for i in idxs]
+        windows.sort(key=lambda window: sum(scores[j] for j in window), reverse=True)
+        order, seen = [], set()
+        for window in windows:
+            for j in window:
+                if j not in seen and len(order) < budget:
+                    seen.add(j)
+                    order.append(j)
+            if len(order) >= budget:
+                break
+        return order
+
     @torch.no_grad()
-    def process(self, batch, threshold=0.5, batch_size=64):
+    def process(self, batch, threshold=0.5, batch_size=64, budget=None, step=4, vote_filter=None, candidates=None):
+        """
+        OCR the jersey number of the legible crops.
+
+        With a budget, at most budget crops are OCR'd in the order of budget_order, step crops at a
+        time, and OCR stops as soon as vote_filter reports the tracklet vote as settled.
+        batch['jersey_number_processed'] then marks the crops whose reading is final: the ones
+        that were OCR'd and the illegible ones, which have no number.
+
+        candidates restricts OCR to these crop indices, keeping the detections already in the batch,
+        so the VLM can complete the output of another engine.
+        """
         real_bs = len(batch['imgs'])
-        jersey_number_detection = [None] * real_bs
-        jersey_number_confidence = [0.0] * real_bs
-        jersey_number_full_detection = [''] * real_bs
+        jersey_number_detection = list(batch.get('jersey_number_detection', [None] * real_bs))
+        jersey_number_confidence = list(batch.get('jersey_number_confidence', [0.0] * real_bs))
+        jersey_number_full_detection = list(batch.get('jersey_number_full_detection', [''] * real_bs))
+        jersey_number_processed = list(batch.get('jersey_number_processed', [False] * real_bs))
+        batch['jersey_number_detection'] = jersey_number_detection
+        batch['jersey_number_confidence'] = jersey_number_confidence
+        if budget is not None or 'jersey_number_processed' in batch:
+            batch['jersey_number_processed'] = jersey_number_processed
 
         # Create a list of valid indices based on legibility filter
         idxs = []
@@ -112,65 +441,40 @@ class QWEN2_5VL_OCR_BATCH():
                     idxs.append(i)
         else:
             idxs = list(range(len(batch['imgs'])))
+        if 'jersey_number_processed' in batch:
+            legible = set(idxs)
+            for i in range(real_bs):
+                if i not in legible:
+                    jersey_number_processed[i] = True
+        if candidates is not None:
+            candidates = set(candidates)
+            idxs = [i for i in idxs if i in candidates]
+
+        if budget is not None:
+            idxs = self.budget_order(idxs, batch['legibility_score'], budget)
+            chunks = [idxs[i:i + step] for i in range(0, len(idxs), step)]
+        else:
+            chunks = [idxs] if idxs else []
 
         if len(idxs) > 0:
-            print(f"Processing {len(idxs)} images")
-            imgs = [batch['imgs'][idx] for idx in idxs] 
-            num_batches = (len(idxs) + batch_size - 1) // batch_size
-            all_generated_text = []
-
-            for i in range(num_batches):
-                batch_start = i * batch_size
-                batch_end = min((i + 1) * batch_size, len(idxs))
-                batch_imgs = imgs[batch_start:batch_end]
-
-                messages = [
-                        [
-                            {
-                                "role": "user", 
-                                "content":[
-                                    {
-                                        "type": "image",
-                                        "image": img
-                                    }, 
-                                    {"type": "text", "text": self.text_prompt}
-                                ]
-                            }
-                        ] for img in batch_imgs
-                    ]
-
-                texts = [
-                    self.processor.apply_chat_template(msg, tokenize=False, add_generation_prompt=True)
-                    for msg in messages
-                ]
-                image_inputs, video_inputs = process_vision_info(messages)
-
-                inputs = self.processor(
-                    text=texts,
-                    images=image_inputs,
-                    videos=video_inputs,
-                    padding=True,
-                    return_tensors="pt",
-                )
-                inputs = inputs.to(self.device)
-                generated_ids = self.model.generate(**inputs, max_new_tokens=128)
-                generated_ids_trimmed = [
-                    out_ids[len(in_ids):] for in_ids, out_ids in zip(inputs.input_ids, generated_ids)
-                ]
-                output_texts = self.processor.batch_decode(
-                    generated_ids_trimmed, skip_special_tokens=True, clean_up_tokenization_spaces=False
-                )
-                all_generated_text.extend(output_texts)
+            print(f"Processing up to {len(idxs)} images")
+        done = 0
+        for chunk in chunks:
+            all_generated_text = self._generate([batch['imgs'][idx] for idx in chunk], batch_size)
 
-            for idx, output_text in zip(idxs, all_generated_text):
+            for idx, output_text in zip(chunk, all_generated_text):
                 jersey_number = self.extract_numbers(output_text)
                 jersey_number_detection[idx] = jersey_number
                 jersey_number_confidence[idx] = 1.0 if jersey_number is not None else 0.0
+                jersey_number_processed[idx] = True
                 if self.save_jersey_number_full_detection:
                     jersey_number_full_detection[idx] = output_text
 
-        batch['jersey_number_detection'] = jersey_number_detection
-        batch['jersey_number_confidence'] = jersey_number_confidence
+            done += len(chunk)
+            if vote_filter is not None and vote_filter.is_settled(batch, remaining=len(idxs) - done):
+                print(f"Vote settled after {done} images")
+                break
+
         if self.save_jersey_number_full_detection:
             batch['jersey_number_full_detection'] = jersey_number_full_detection
 
@@ -195,14 +499,17 @@ class MajorityVoteTrackletFilter():
         max_value = max(value_counts, key=value_counts.get)
         return max_value
 
-    @torch.no_grad()
-    def process(self, tracklet):
-        attribute_detection = tracklet['jersey_number_detection']
-        attribute_confidence = tracklet['jersey_number_confidence']
+    def filtered_votes(self, tracklet):
+        """
+        Detections kept by the consecutive filter, with their confidences.
 
-        # Convert to list for easier manipulation
-        detection_list = list(attribute_detection)
-        confidence_list = list(attribute_confidence)
+        A detection is kept if it matches its neighbours in a window of 3. When the tracklet has a
+        jersey_number_processed mask, neighbours that were never OCR'd are ignored, but at least one
+        processed neighbour must agree, so an isolated read is never kept.
+        """
+        detection_list = list(tracklet['jersey_number_detection'])
+        confidence_list = list(tracklet['jersey_number_confidence'])
+        processed = tracklet.get('jersey_number_processed', [True] * len(detection_list))
 
         # First pass: filter out values without 3 consecutive matches
         filtered_detection = detection_list.copy()
@@ -210,11 +517,13 @@ class MajorityVoteTrackletFilter():
             # Get window of 3 centered at current position
             start = max(0, i-1)
             end = min(len(detection_list), i+2)
-            window = detection_list[start:end]
+            neighbours = [detection_list[j] for j in range(start, end) if j != i and processed[j]]
 
             # Check if current value matches all values in window
             current_val = detection_list[i]
-            if current_val is None or not all(v == current_val for v in window):
+            if current_val is None or not all(v == current_val for v in neighbours):
+                filtered_detection[i] = None
+            elif end - start > 1 and not neighbours:
                 filtered_detection[i] = None
 
         # Create filtered lists removing None values
@@ -224,6 +533,34 @@ class MajorityVoteTrackletFilter():
             if d is not None:
                 final_detection.append(d)
                 final_confidence.append(c)
+        return final_detection, final_confidence
+
+    def is_settled(self, tracklet, remaining, alpha=0.05):
+        """
+        Whether OCR'ing more crops can no longer change the vote, or is unlikely to.
+
+        The vote is settled when the leader's margin over the runner-up exceeds the remaining
+        crops, or when a one-sided sign test rejects the leader and runner-up being equally
+        likely at level alpha.
+        """
+        final_detection, final_confidence = self.filtered_votes(tracklet)
+        counts = {}
+        for d, c in zip(final_detection, final_confidence):
+            counts[d] = counts.get(d, 0) + c
+        if not counts:
+            return False
+        ranked = sorted(counts.values(), reverse=True)
+        leader = int(round(ranked[0]))
+        runner_up = int(round(ranked[1])) if len(ranked) > 1 else 0
+        if leader - runner_up > remaining:
+            return True
+        n = leader + runner_up
+        p_value = sum(math.comb(n, k) for k in range(leader, n + 1)) / 2 ** n
+        return p_value < alpha
+
+    @torch.no_grad()
+    def process(self, tracklet):
+        final_detection, final_confidence = self.filtered_votes(tracklet)
 
         # Get majority vote from filtered values
         if final_detection:
@@ -231,22 +568,100 @@ class MajorityVoteTrackletFilter():
         else:
             attribute_value = None
 
-        tracklet['jn_final'] = [attribute_value] * len(detection_list)
+        tracklet['jn_final'] = [attribute_value] * len(tracklet['jersey_number_detection'])
 
         return attribute_value, tracklet
 
 
-def run(device, img_list, model_path, qwen_path, threshold=0.5):
-    lc = Legibility(model_path, device)
-    lc_score = lc.process(img_list, threshold)
-    # print(lc_score)
+class JerseyNumberService():
+    """
+    Legibility classifier, Qwen2.5-VL OCR and tracklet vote loaded once and kept resident.
+
+    Both models are loaded in the constructor, so a long-lived instance answers every call
+    with inference only. warmup() runs a dummy crop through the pipeline, paying the CUDA
+    context, cudnn autotuning and flash-attention kernel setup ahead of the first request.
+    """
+
+    def __init__(self, legibility_model_path, qwen_model_path, device, threshold=0.5, budget=None, step=4, digit_model_path=None):
+        """
+        Args:
+            legibility_model_path: ResNet34 legibility checkpoint
+            qwen_model_path: Qwen2.5-VL model name or path
+            device: Torch device
+            threshold: Legibility score for a crop to be OCR'd
+            budget: Most crops OCR'd per tracklet, picked by QWEN2_5VL_OCR_BATCH.budget_order, None to OCR every legible crop
+            step: Crops OCR'd between two checks of the vote
+            digit_model_path: DigitRecognizer checkpoint, when it exists crops are read by it first and the VLM only gets
+                              the crops it is unsure about
+        """
+        self.device = device
+        self.threshold = threshold
+        self.budget = budget
+        self.step = step
+        self.legibility = Legibility(legibility_model_path, device)
+        self.ocr = QWEN2_5VL_OCR_BATCH(qwen_model_path=qwen_model_path, device=device)
+        self.digits = None
+        if digit_model_path is not None and os.path.exists(digit_model_path):
+            self.digits = DIGIT_OCR_BATCH(digit_model_path, device)
+        elif digit_model_path is not None:
+            print(f"Digit recognizer weights not found at {digit_model_path}, using the VLM only (see train_digit_recognizer.py)")
+        self.filter = MajorityVoteTrackletFilter()
+
+    def warmup(self):
+        dummy = Image.new("RGB", (64, 128), (128, 128, 128))
+        self.legibility.process([dummy], self.threshold)
+        if self.digits is not None:
+            self.digits.process({"imgs": [dummy], "legibility_score": [1.0]}, self.threshold)
+        self.ocr.process({"imgs": [dummy], "legibility_score": [1.0]}, self.threshold)
+
+    def process(self, images):
+        """
+        Jersey number of a tracklet of player crops.
+
+        Returns:
+            (voted jersey number or None, per-crop results)
+        """
+        # Raw scores, so the budgeted OCR can rank the crops
+        lc_score = self.legibility.process(images, threshold=0)
+        return self._read_numbers(images, lc_score)
+
+    def process_paths(self, paths):
+        """
+        Jersey number of a tracklet given as image files.
+
+        Crops are decoded ahead by iter_crops while legibility scoring runs, and only the crops
+        picked for OCR are decoded again, so the tracklet is never held in memory as a whole.
+        """
+        lc_score = self.legibility.process(iter_crops(paths), threshold=0)
+        return self._read_numbers(LazyCrops(paths), lc_score)
+
+    def _read_numbers(self, images, lc_score):
+        results = {"imgs": images, "legibility_score": lc_score}
+        candidates = None
+        if self.digits is not None:
+            results = self.digits.process(results, self.threshold)
+            # Legible crops the CNN was unsure about, illegible ones are already marked processed
+            candidates = [i for i, processed in enumerate(results['jersey_number_processed']) if not processed]
+            if self.filter.is_settled(results, remaining=len(candidates)):
+                return self.filter.process(results)
+        results = self.ocr.process(
+            results, self.threshold,
+            budget=self.budget, step=self.step, vote_filter=self.filter if self.budget is not None else None,
+            candidates=candidates,
+        )
+        return self.filter.process(results)
+
+
+_services = {}
 
-    qwen = QWEN2_5VL_OCR_BATCH(qwen_model_path=qwen_path, device=device)
-    results = qwen.process({"imgs": img_list, "legibility_score": lc_score}, threshold)
-    # print(results)
 
-    filter = MajorityVoteTrackletFilter()
-    ans, results = filter.process(results)
+def get_jersey_number_service(device, model_path, qwen_path, threshold=0.5, digit_model_path=None):
+    """The resident JerseyNumberService for these models, created on first use."""
+    key = (str(device), model_path, qwen_path, threshold, digit_model_path)
+    if key not in _services:
+        _services[key] = JerseyNumberService(model_path, qwen_path, device, threshold, digit_model_path=digit_model_path)
+    return _services[key]
 
-    # print(ans)
-    return ans, results
+
+def run(device, img_list, model_path, qwen_path, threshold=0.5):
+    return get_jersey_number_service(device, model_path, qwen_path, threshold).process(img_list)
@@ -0,0 +1,158 @@
+import os
+import hashlib
+from typing import Dict, List, Optional
+
+import torch
+from PIL import Image
+from transformers import DynamicCache
+
+
+class QwenVLPrefixCache:
+    """
+    Transformer KV cache of a fixed multi-image chat prefix for Qwen2.5-VL.
+
+    The prefix (system prompt plus few-shot exemplars) is encoded by the vision tower and prefilled
+    once, then persisted to disk. Every query only prefills its own suffix (new image + question)
+    on top of a copy of the cached keys/values, and decodes greedily from there.
+    """
+
+    def __init__(self, processor, model, prefix_messages: List[Dict], cache_dir: str, tag: str = "prefix"):
+        """
+        Args:
+            processor: Qwen2.5-VL processor (tokenizer + image processor)
+            model: Qwen2.5-VL model
+            prefix_messages: Chat messages shared by every query, images given as PIL objects
+            cache_dir: Directory where the prefilled cache is persisted
+            tag: File name prefix of the persisted cache
+        """
+        self.processor = processor
+        self.model = model
+        self.prefix_messages = prefix_messages
+        self.prefix_text = processor.apply_chat_template(prefix_messages, tokenize=False, add_generation_prompt=False)
+        self.cache_path = os.path.join(cache_dir, f"{tag}_{self._fingerprint()}.pt")
+        self._state = None
+
+    def _fingerprint(self) -> str:
+        digest = hashlib.sha1()
+        digest.update(str(self.model.config._name_or_path).encode())
+        digest.update(str(self.model.dtype).encode())
+        digest.update(self.prefix_text.encode())
+        for image in self._images(self.prefix_messages):
+            digest.update(image.tobytes())
+        return digest.hexdigest()[:16]
+
+    @staticmethod
+    def _images(messages: List[Dict]) -> List[Image.Image]:
+        return [item["image"] for msg in messages if isinstance(msg["content"], list)
+                for item in msg["content"] if item["type"] == "image"]
+
+    def _prefill(self) -> Dict:
+        inputs = self.processor(text=[self.prefix_text], images=self._images(self.prefix_messages), return_tensors="pt").to(self.model.device)
+        with torch.inference_mode():
+            outputs = self.model(**inputs, past_key_values=DynamicCache(), use_cache=True)
+        return {
+            "input_ids": inputs.input_ids.cpu(),
+            "image_grid_thw": inputs.image_grid_thw.cpu(),
+            "key_value": tuple((k.cpu(), v.cpu()) for k, v in outputs.past_key_values.to_legacy_cache()),
+        }
+
+    def load(self) -> Dict:
+        """Load the prefilled prefix from memory, disk, or compute and persist it."""
+        if self._state is not None:
+            return self._state
+        if os.path.exists(self.cache_path):
+            state = torch.load(self.cache_path, map_location="cpu")
+        else:
+            state = self._prefill()
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            # Other processes may load the cache meanwhile, they must never see it half-written
+            tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            torch.save(state, tmp_path)
+            os.replace(tmp_path, self.cache_path)
+        device = self.model.device
+        self._state = {
+            "input_ids": state["input_ids"].to(device),
+            "image_grid_thw": state["image_grid_thw"].to(device),
+            "key_value": tuple((k.to(device), v.to(device)) for k, v in state["key_value"]),
+        }
+        return self._state
+
+    def split_suffix(self, messages: List[Dict]) -> Optional[str]:
+        """Chat text following the cached prefix, or None if the messages don't extend it."""
+        text = self.processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        if not text.startswith(self.prefix_text):
+            return None
+        return text[len(self.prefix_text):]
+
+    def _eos_ids(self) -> List[int]:
+        eos = self.model.generation_config.eos_token_id
+        eos = eos if isinstance(eos, list) else [eos]
+        return [e for e in eos if e is not None]
+
+    @torch.inference_mode()
+    def generate(self, suffix_texts: List[str], images: List[Image.Image], max_new_tokens: int = 32) -> List[str]:
+        """
+        Greedy decoding of a batch of suffixes that share the cached prefix.
+
+        Args:
+            suffix_texts: Chat text after the prefix, one per query, each holding a single image
+            images: Query images, one per suffix; all suffixes must tokenize to the same length
+            max_new_tokens: Generation budget
+
+        Returns:
+            Decoded replies, one per suffix
+        """
+        state = self.load()
+        device = self.model.device
+        batch_size = len(suffix_texts)
+        inputs = self.processor(text=suffix_texts, images=images, return_tensors="pt").to(device)
+
+        prefix_ids = state["input_ids"].expand(batch_size, -1)
+        full_ids = torch.cat([prefix_ids, inputs.input_ids], dim=1)
+        query_grids = inputs.image_grid_thw.view(batch_size, -1, 3)
+        full_grid = torch.cat([torch.cat([state["image_grid_thw"], grid]) for grid in query_grids])
+        attention_mask = torch.ones_like(full_ids)
+        position_ids, rope_deltas = self.model.get_rope_index(
+            input_ids=full_ids, image_grid_thw=full_grid, attention_mask=attention_mask
+        )
+
+        past_len = prefix_ids.shape[1]
+        cache = DynamicCache.from_legacy_cache(tuple(
+            (k.expand(batch_size, -1, -1, -1), v.expand(batch_size, -1, -1, -1)) for k, v in state["key_value"]
+        ))
+        seq_len = full_ids.shape[1]
+        outputs = self.model(
+            input_ids=inputs.input_ids,
+            pixel_values=inputs.pixel_values,
+            image_grid_thw=inputs.image_grid_thw,
+            attention_mask=attention_mask,
+            position_ids=position_ids[:, :, past_len:],
+            past_key_values=cache,
+            cache_position=torch.arange(past_len, seq_len, device=device),
+            use_cache=True,
+        )
+
+        eos_ids = torch.tensor(self._eos_ids(), device=device)
+        finished = torch.zeros(batch_size, dtype=torch.bool, device=device)
+        generated = []
+        for _ in range(max_new_tokens):
+            next_tokens = outputs.logits[:, -1, :].argmax(dim=-1)
+            next_tokens = torch.where(finished, eos_ids[0], next_tokens)
+            generated.append(next_tokens)
+            finished |= torch.isin(next_tokens, eos_ids)
+            if finished.all():
+                break
+            attention_mask = torch.cat([attention_mask, attention_mask.new_ones(batch_size, 1)], dim=1)
+            step_position = (seq_len + rope_deltas).view(1, batch_size, 1).expand(3, -1, -1)
+            outputs = self.model(
+                input_ids=next_tokens[:, None],
+                attention_mask=attention_mask,
+                position_ids=step_position,
+                past_key_values=outputs.past_key_values,
+                cache_position=torch.tensor([seq_len], device=device),
+                use_cache=True,
+            )
+            seq_len += 1
+
+        generated = torch.stack(generated, dim=1)
+        return self.processor.batch_decode(generated, skip_special_tokens=True)
@@ -0,0 +1,196 @@
+import os
+import re
+import json
+import time
+import threading
+from urllib.error import URLError
+
+import cv2
+import easyocr
+
+
+TIME_PATTERN = re.compile(r'(\d{1,2})[:.-](\d{2})')
+SCORE_PATTERN = re.compile(r'^\d{1,2}\s*[-:]\s*\d{1,2}$|^\d{1,2}$')
+TEAM_PATTERN = re.compile(r'^[A-Z]{2,4}$')
+
+_reader = None
+_reader_lock = threading.Lock()
+
+
+def get_reader(max_retries=3):
+    """The process-wide easyocr Reader, its detection and recognition weights are loaded only once."""
+    global _reader
+    with _reader_lock:
+        if _reader is not None:
+            return _reader
+        for attempt in range(max_retries):
+            try:
+                _reader = easyocr.Reader(['en'], download_enabled=True, gpu=False)
+                break
+            except URLError as e:
+                print(f"Download failed easyocr model, Attempt: {attempt + 1}/{max_retries}: {e}")
+                if attempt == max_retries - 1:
+                    return None
+                time.sleep(5)
+        return _reader
+
+
+def parse_clock(text):
+    """(minutes, seconds) of a game clock reading, or None."""
+    match = TIME_PATTERN.search(text)
+    if match:
+        minutes = int(match.group(1))
+        seconds = int(match.group(2))
+        if 0 <= minutes <= 90 and 0 <= seconds < 60:
+            return minutes, seconds
+    return None
+
+
+def parse_scoreboard(results):
+    """
+    Structured reading of scoreboard OCR results.
+
+    Returns:
+        {"clock": (minutes, seconds) or None, "clock_confidence": float,
+         "score": (home, away) or None, "score_confidence": float, "teams": [str]}
+    """
+    boxes = sorted(results, key=lambda r: min(x for x, _ in r[0]))
+    reading = {"clock": None, "clock_confidence": 0.0, "score": None, "score_confidence": 0.0, "teams": []}
+
+    clock_box = None
+    for box in boxes:
+        clock = parse_clock(box[1])
+        if clock and box[2] > reading["clock_confidence"]:
+            reading["clock"], reading["clock_confidence"], clock_box = clock, float(box[2]), box
+
+    numbers = []
+    for box in boxes:
+        if box is clock_box:
+            continue
+        text = box[1].strip()
+        match = re.match(r'^(\d{1,2})\s*-\s*(\d{1,2})$', text)
+        if match and reading["score"] is None:
+            reading["score"] = (int(match.group(1)), int(match.group(2)))
+            reading["score_confidence"] = float(box[2])
+        elif re.match(r'^\d{1,2}$', text):
+            numbers.append(box)
+        elif TEAM_PATTERN.match(text):
+            reading["teams"].append(text)
+    if reading["score"] is None and len(numbers) >= 2:
+        reading["score"] = (int(numbers[0][1]), int(numbers[1][1]))
+        reading["score_confidence"] = float(min(numbers[0][2], numbers[1][2]))
+    reading["teams"] = reading["teams"][:2]
+    return reading
+
+
+class ScoreboardOCR:
+    """
+    OCR restricted to the broadcast scoreboard.
+
+    The scoreboard region is located once per broadcast layout: the top band of the frame is
+    searched first, since that is where broadcasters put the score bug, then the full frame.
+    The region around the clock, score and team abbreviations is cached per layout in memory
+    and in a JSON file, so later frames only OCR that small crop. If the crop stops yielding
+    a clock, the region is located again.
+    """
+
+    def __init__(self, roi_cache_path, top_band=0.3, margin=0.3):
+        """
+        Args:
+            roi_cache_path: JSON file persisting the scoreboard region of every layout
+            top_band: Fraction of the frame height searched before falling back to the full frame
+            margin: Padding added around the located region, relative to its height
+        """
+        self.roi_cache_path = roi_cache_path
+        self.top_band = top_band
+        self.margin = margin
+        self.rois = {}
+        if os.path.exists(roi_cache_path):
+            with open(roi_cache_path, 'r') as f:
+                self.rois = json.load(f)
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.roi_cache_path), exist_ok=True)
+        # Other processes load this file at import time, they must never see it half-written
+        tmp_path = f"{self.roi_cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.rois, f)
+        os.replace(tmp_path, self.roi_cache_path)
+
+    @staticmethod
+    def _readtext(reader, image, x0=0, y0=0):
+        # Boxes are shifted back to full-frame coordinates
+        results = []
+        for bbox, text, confidence in reader.readtext(image):
+            bbox = [[int(x) + x0, int(y) + y0] for x, y in bbox]
+            results.append((bbox, text, confidence))
+        return results
+
+    def _roi_from_results(self, results, width, height):
+        clocks = [r for r in results if parse_clock(r[1])]
+        if not clocks:
+            return None
+        clock = max(clocks, key=lambda r: r[2])
+        ys = [y for _, y in clock[0]]
+        top, bottom = min(ys), max(ys)
+        span = bottom - top
+        # Score and team boxes sit on the clock's row in the score bug
+        row = [clock] + [r for r in results if r is not clock and (SCORE_PATTERN.match(r[1].strip()) or TEAM_PATTERN.match(r[1].strip()))
+                         and top - span <= sum(y for _, y in r[0]) / 4 <= bottom + span]
+        xs = [x for r in row for x, _ in r[0]]
+        ys = [y for r in row for _, y in r[0]]
+        pad = self.margin * span + 4
+        return [
+            max(0.0, (min(xs) - pad) / width), max(0.0, (min(ys) - pad) / height),
+            min(1.0, (max(xs) + pad) / width), min(1.0, (max(ys) + pad) / height),
+        ]
+
+    def localize(self, reader, image, layout_key):
+        """Find and cache the scoreboard region, returning the full OCR results used for it."""
+        height, width = image.shape[:2]
+        band = int(height * self.top_band)
+        results = self._readtext(reader, image[:band])
+        roi = self._roi_from_results(results, width, height)
+        if roi is None:
+            results = self._readtext(reader, image)
+            roi = self._roi_from_results(results, width, height)
+        if roi is not None:
+            self.rois[layout_key] = roi
+            self._save()
+        return results
+
+    def read(self, image, layout_key=None):
+        """
+        OCR the scoreboard of a frame.
+
+        Args:
+            image: BGR array or image path
+            layout_key: Identifies the broadcast layout, defaults to the frame resolution
+
+        Returns:
+            easyocr results (bbox, text, confidence) in full-frame coordinates, or None if the reader is unavailable
+        """
+        reader = get_reader()
+        if reader is None:
+            return None
+        if isinstance(image, str):
+            image = cv2.imread(image)
+        height, width = image.shape[:2]
+        layout_key = layout_key or f"{width}x{height}"
+
+        roi = self.rois.get(layout_key)
+        if roi is not None:
+            x0, y0 = int(roi[0] * width), int(roi[1] * height)
+            x1, y1 = int(roi[2] * width), int(roi[3] * height)
+            results = self._readtext(reader, image[y0:y1, x0:x1], x0, y0)
+            if any(parse_clock(text) for _, text, _ in results):
+                return results
+        return self.localize(reader, image, layout_key)
+
+    def crop(self, image, layout_key):
+        """The cached scoreboard region of a frame, or None if the layout hasn't been located yet."""
+        roi = self.rois.get(layout_key)
+        if roi is None:
+            return None
+        height, width = image.shape[:2]
+        return image[int(roi[1] * height):int(roi[3] * height), int(roi[0] * width):int(roi[2] * width)]
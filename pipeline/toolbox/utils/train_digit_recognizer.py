@@ -0,0 +1,157 @@
+"""
+Train the DigitRecognizer read by DIGIT_OCR_BATCH and export its state dict.
+
+Crops are read from a directory laid out as <data_dir>/<label>/<image>, where label is the
+jersey number (1 or 2 digits) or "none" for crops with no readable number, e.g. the per-crop
+readings of QWEN2_5VL_OCR_BATCH reviewed by hand. The checkpoint with the best validation
+accuracy is written to --output, the path jn_rec.py loads by default.
+
+    python train_digit_recognizer.py --data_dir /data/jersey_crops --output jersey_digits_cnn.pth
+"""
+import os
+import sys
+import random
+import argparse
+from project_path import PROJECT_PATH
+sys.path.append(f"{PROJECT_PATH}/pipeline/toolbox")
+
+import torch
+import torch.nn.functional as F
+from torch.utils.data import Dataset, DataLoader
+from torchvision import transforms
+from PIL import Image
+from utils.jn import DigitRecognizer, DIGIT_OCR_BATCH
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+# Must match the inference transforms of DIGIT_OCR_BATCH
+EVAL_TRANSFORMS = transforms.Compose([
+    transforms.Resize((128, 64)),
+    transforms.ToTensor(),
+    transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+])
+TRAIN_TRANSFORMS = transforms.Compose([
+    transforms.Resize((128, 64)),
+    transforms.RandomAffine(degrees=5, translate=(0.05, 0.05), scale=(0.9, 1.1)),
+    transforms.ColorJitter(brightness=0.3, contrast=0.3, saturation=0.3),
+    transforms.ToTensor(),
+    transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+])
+
+
+def encode_label(label):
+    """(digit count, first digit, second digit) targets of a label, -100 for the absent digits."""
+    if label == "none":
+        return 0, -100, -100
+    if len(label) == 1:
+        return 1, int(label), -100
+    return 2, int(label[0]), int(label[1])
+
+
+def collect_crops(data_dir):
+    samples = []
+    for label in sorted(os.listdir(data_dir)):
+        label_dir = os.path.join(data_dir, label)
+        if not os.path.isdir(label_dir):
+            continue
+        if label != "none" and not (label.isdigit() and len(label) <= 2):
+            print(f"Skipping {label_dir}: not a jersey number or 'none'")
+            continue
+        for file in sorted(os.listdir(label_dir)):
+            if file.lower().endswith(IMAGE_EXTENSIONS):
+                samples.append((os.path.join(label_dir, file), label))
+    return samples
+
+
+class CropDataset(Dataset):
+    def __init__(self, samples, transform):
+        self.samples = samples
+        self.transform = transform
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, idx):
+        path, label = self.samples[idx]
+        image = self.transform(Image.open(path).convert("RGB"))
+        return (image, *[torch.tensor(t) for t in encode_label(label)]), label
+
+
+@torch.no_grad()
+def evaluate(model, loader, device, min_confidence):
+    """(exact accuracy, share of crops kept at min_confidence, accuracy of the kept crops)"""
+    model.eval()
+    correct = kept = kept_correct = total = 0
+    for (images, _, _, _), labels in loader:
+        readings = DIGIT_OCR_BATCH.decode(*model(images.to(device)))
+        for (number, confidence), label in zip(readings, labels):
+            hit = (number or "none") == label
+            correct += hit
+            total += 1
+            if confidence >= min_confidence:
+                kept += 1
+                kept_correct += hit
+    return correct / max(total, 1), kept / max(total, 1), kept_correct / max(kept, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the jersey number DigitRecognizer")
+    parser.add_argument("--data_dir", required=True)
+    parser.add_argument("--output", default=f"{PROJECT_PATH}/pipeline/toolbox/utils/jersey_digits_cnn.pth")
+    parser.add_argument("--epochs", type=int, default=30)
+    parser.add_argument("--batch_size", type=int, default=128)
+    parser.add_argument("--lr", type=float, default=1e-3)
+    parser.add_argument("--val_split", type=float, default=0.1)
+    parser.add_argument("--min_confidence", type=float, default=0.8, help="Level at which the kept crops are reported")
+    parser.add_argument("--num_workers", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    samples = collect_crops(args.data_dir)
+    if not samples:
+        raise ValueError(f"No labelled crops found in {args.data_dir}")
+    random.Random(args.seed).shuffle(samples)
+    num_val = max(1, int(len(samples) * args.val_split))
+    train_loader = DataLoader(CropDataset(samples[num_val:], TRAIN_TRANSFORMS), batch_size=args.batch_size,
+                              shuffle=True, num_workers=args.num_workers, drop_last=len(samples) - num_val > args.batch_size)
+    val_loader = DataLoader(CropDataset(samples[:num_val], EVAL_TRANSFORMS), batch_size=args.batch_size, num_workers=args.num_workers)
+    print(f"{len(samples) - num_val} training crops, {num_val} validation crops.")
+
+    torch.manual_seed(args.seed)
+    model = DigitRecognizer().to(args.device)
+    optimizer = torch.optim.AdamW(model.parameters(), lr=args.lr, weight_decay=1e-4)
+    scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=args.epochs)
+
+    best_accuracy = -1.0
+    for epoch in range(args.epochs):
+        model.train()
+        total_loss = 0.0
+        for (images, length, first, second), _ in train_loader:
+            images, length, first, second = (t.to(args.device) for t in (images, length, first, second))
+            length_logits, first_logits, second_logits = model(images)
+            loss = F.cross_entropy(length_logits, length)
+            # Digits absent from a label are ignored, a batch of "none" crops has no digit loss
+            if (first != -100).any():
+                loss = loss + F.cross_entropy(first_logits, first, ignore_index=-100)
+            if (second != -100).any():
+                loss = loss + F.cross_entropy(second_logits, second, ignore_index=-100)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            total_loss += loss.item() * len(images)
+        scheduler.step()
+
+        accuracy, coverage, kept_accuracy = evaluate(model, val_loader, args.device, args.min_confidence)
+        print(f"Epoch {epoch + 1}/{args.epochs}: loss {total_loss / len(train_loader.dataset):.4f}, "
+              f"val accuracy {accuracy:.3f}, at min_confidence {args.min_confidence}: "
+              f"{coverage:.1%} of crops kept, {kept_accuracy:.3f} accurate")
+        if accuracy > best_accuracy:
+            best_accuracy = accuracy
+            os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+            torch.save(model.state_dict(), args.output + ".tmp")
+            os.replace(args.output + ".tmp", args.output)
+    print(f"Best val accuracy {best_accuracy:.3f}, weights written to {args.output}.")
+
+
+if __name__ == "__main__":
+    main()